@@ -1,13 +1,22 @@
 from dash import Dash, html, dcc, callback, Output, Input, State
 import dash_mantine_components as dmc
-import plotly.express as px
-import pandas as pd
 from dash_iconify import DashIconify
 from components.pricebydistrict import (
-    pricebydistrict_layout,
+    get_pricebydistrict_layout,
     register_callbacks_mapview,
 )
-from components.calculator import calculator_layout, register_callbacks_calculator
+from components.calculator import (
+    get_calculator_layout,
+    register_callbacks_calculator,
+)
+from components.address_index import register_address_routes
+from components.spatial_index import register_location_routes
+from components.scoring import register_scoring_routes
+from components.profiling import profiled, register_profiling_routes
+from components.district_map import (
+    register_callbacks_district_map,
+    register_geometry_routes,
+)
 
 app = Dash(
     __name__,
@@ -192,6 +201,12 @@ app.layout = dmc.MantineProvider(layout)
 
 register_callbacks_mapview(app)
 register_callbacks_calculator(app)
+register_address_routes(app)
+register_location_routes(app)
+register_scoring_routes(app)
+register_profiling_routes(app)
+register_geometry_routes(app)
+register_callbacks_district_map(app)
 
 
 
@@ -201,16 +216,18 @@ register_callbacks_calculator(app)
     State("modal", "opened"),
     prevent_initial_call=True,
 )
+@profiled
 def toggle_modal(n_clicks, opened):
     return not opened
 
 
 @callback(Output("tabs-content", "children"), Input("tabs", "value"))
+@profiled
 def render_content(active):
     if active == "pricebydistrict":
-        return pricebydistrict_layout
+        return get_pricebydistrict_layout()
     else:
-        return calculator_layout
+        return get_calculator_layout()
 
 
 
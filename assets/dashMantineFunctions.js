@@ -0,0 +1,7 @@
+var dmcfuncs = (window.dashMantineFunctions = window.dashMantineFunctions || {});
+
+// The suggestions are already matched (including typos) on the server, so
+// show them as they are instead of filtering them again by substring.
+dmcfuncs.keepServerSuggestions = function ({ options }) {
+    return options;
+};
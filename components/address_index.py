@@ -0,0 +1,267 @@
+import bisect
+import difflib
+import re
+
+from flask import jsonify, request
+
+from components.address_store import (
+    SnapshotValue,
+    current_version,
+    snapshot_checked_at,
+)
+from components.address_table import (
+    UNKNOWN,
+    format_house_number,
+    get_address_table,
+    split_house_number,
+)
+from components.mietspiegel import QUALITIES, STADTTEILE
+
+# Most street suggestions one request may ask for
+MAX_SUGGESTIONS = 50
+
+_UMLAUTS = str.maketrans({"ß": "ss", "ä": "ae", "ö": "oe", "ü": "ue"})
+
+
+def normalize_street(street):
+    # "Karl-Marx-Str." and "karl marx strasse" both become "karl marx strasse"
+    street = str(street).casefold().translate(_UMLAUTS)
+    street = re.sub(r"str\b\.?", "strasse", street)
+    return re.sub(r"\W+", " ", street).strip()
+
+
+def normalize_house_number(house_number):
+    house_number = split_house_number(house_number)
+    if house_number is None:
+        return None
+    return format_house_number(*house_number)
+
+
+class AddressIndex:
+    """Sorted arrays of all street names, searchable by prefix.
+
+    A second sorted array holds each word of every street name, so "marx"
+    also finds "Karl-Marx-Allee". Postcodes and house numbers are read from
+    the street's slice of the AddressTable.
+    """
+
+    def __init__(self, table):
+        self._table = table
+
+        street_ids = {}
+        for street_id, street in enumerate(table.streets):
+            street_ids.setdefault(normalize_street(street), street_id)
+
+        self._keys = sorted(street_ids)
+        self._street_ids = [street_ids[key] for key in self._keys]
+
+        words = sorted(
+            (key[match.start():], i)
+            for i, key in enumerate(self._keys)
+            for match in re.finditer(r"\b\w", key)
+            if match.start() > 0
+        )
+        self._word_keys = [word for word, _ in words]
+        self._word_ids = [i for _, i in words]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _find(self, street):
+        key = normalize_street(street)
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return self._street_ids[i]
+        return None
+
+    def _name(self, i):
+        return self._table.streets[self._street_ids[i]]
+
+    def suggest_streets(self, query, limit=10):
+        key = normalize_street(query)
+        if not key:
+            return []
+
+        ids = []
+        i = bisect.bisect_left(self._keys, key)
+        while i < len(self._keys) and len(ids) < limit and self._keys[i].startswith(key):
+            ids.append(i)
+            i += 1
+
+        i = bisect.bisect_left(self._word_keys, key)
+        while (
+            i < len(self._word_keys)
+            and len(ids) < limit
+            and self._word_keys[i].startswith(key)
+        ):
+            if self._word_ids[i] not in ids:
+                ids.append(self._word_ids[i])
+            i += 1
+
+        if not ids:
+            ids = self._suggest_similar(key, limit)
+
+        return [self._name(i) for i in ids]
+
+    def _suggest_similar(self, key, limit):
+        # Typo fallback, only compares streets with the same first letter.
+        start = bisect.bisect_left(self._keys, key[0])
+        end = bisect.bisect_left(self._keys, chr(ord(key[0]) + 1))
+        candidates = self._keys[start:end]
+        matches = difflib.get_close_matches(key, candidates, n=limit, cutoff=0.75)
+        return [start + candidates.index(match) for match in matches]
+
+    def _house_number_mask(self, start, end, house_number):
+        house_number = split_house_number(house_number)
+        suffix_id = self._table.suffix_id(house_number[1]) if house_number else None
+        if suffix_id is None:
+            return None
+
+        table = self._table
+        return (table.number[start:end] == house_number[0]) & (
+            table.suffix[start:end] == suffix_id
+        )
+
+    def postcodes(self, street, house_number=None):
+        import numpy as np
+
+        street_id = self._find(street)
+        if street_id is None:
+            return []
+
+        start, end = self._table.street_range(street_id)
+        postcodes = self._table.postcode[start:end]
+
+        if house_number is not None:
+            mask = self._house_number_mask(start, end, house_number)
+            if mask is None:
+                return []
+            postcodes = postcodes[mask]
+
+        return [str(postcode) for postcode in np.unique(postcodes)]
+
+    def house_numbers(self, street, postcode=None):
+        import numpy as np
+
+        street_id = self._find(street)
+        if street_id is None:
+            return []
+
+        table = self._table
+        start, end = table.street_range(street_id)
+        numbers = table.number[start:end].astype(np.uint32)
+        suffixes = table.suffix[start:end]
+
+        if postcode is not None:
+            postcode = str(postcode).strip()
+            if not postcode.isdigit():
+                return []
+            mask = table.postcode[start:end] == int(postcode)
+            numbers, suffixes = numbers[mask], suffixes[mask]
+
+        # Unique (number, suffix) pairs in natural order
+        pairs = np.unique(numbers << 8 | suffixes)
+        return [
+            format_house_number(int(pair >> 8), table.suffixes[pair & 0xFF])
+            for pair in pairs
+        ]
+
+    def _find_address(self, street, house_number, postcode):
+        # (street id, table row) of an address, or None
+        street_id = self._find(street)
+        postcode = str(postcode).strip()
+        house_number = split_house_number(house_number)
+        if street_id is None or not postcode.isdigit() or house_number is None:
+            return None
+
+        suffix_id = self._table.suffix_id(house_number[1])
+        if suffix_id is None:
+            return None
+
+        row = self._table.find(street_id, int(postcode), house_number[0], suffix_id)
+        return None if row is None else (street_id, row)
+
+    def street_name(self, street, house_number, postcode):
+        """Official spelling of the street, or None if the address does not exist."""
+        address = self._find_address(street, house_number, postcode)
+        if address is None:
+            return None
+
+        return self._table.streets[address[0]]
+
+    def location_data(self, street, house_number, postcode):
+        """{"wol", "stadtteil"} of an address, or None."""
+        address = self._find_address(street, house_number, postcode)
+        if address is None:
+            return None
+
+        table = self._table
+        wol, stadtteil = table.wol[address[1]], table.stadtteil[address[1]]
+        if wol == UNKNOWN or stadtteil == UNKNOWN:
+            return None
+
+        return {"wol": QUALITIES[wol], "stadtteil": STADTTEILE[stadtteil]}
+
+
+_address_index = SnapshotValue(AddressIndex, source=get_address_table)
+
+
+def get_address_index():
+    return _address_index.get()
+
+
+def peek_address_index():
+    """The index if it has been built, else None.
+
+    Never waits: the index is built (or rebuilt for a new snapshot) in a
+    background thread, so callbacks do not download the address data.
+    """
+    return _address_index.get_nowait()
+
+
+def address_data_time():
+    """When the data behind the index was fetched, or None if it is not built."""
+    if _address_index.peek() is None:
+        return None
+    if current_version() is not None:
+        return snapshot_checked_at()
+    return _address_index.built_at
+
+
+def canonicalize_address(street, house_number, postcode):
+    """Official street name for an address, or None if it does not exist.
+
+    Until the index has been built the street is returned unchanged and the
+    WFS lookup decides.
+    """
+    index = peek_address_index()
+    if index is None:
+        return street
+
+    return index.street_name(street, house_number, postcode)
+
+
+def register_address_routes(app):
+
+    @app.server.route("/api/address-suggestions")
+    def address_suggestions():
+        # Never downloads in the request, the index is built in the background.
+        index = peek_address_index()
+        if index is None:
+            return jsonify({"error": "address data is not available right now"}), 503
+
+        street = request.args.get("street")
+        if street:
+            house_number = request.args.get("house_number")
+            postcode = request.args.get("postcode")
+
+            return jsonify(
+                {
+                    "postcodes": index.postcodes(street, house_number),
+                    "house_numbers": index.house_numbers(street, postcode),
+                }
+            )
+
+        limit = request.args.get("limit", 10, type=int)
+        limit = max(1, min(limit, MAX_SUGGESTIONS))
+        return jsonify({"streets": index.suggest_streets(request.args.get("q", ""), limit)})
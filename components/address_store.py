@@ -0,0 +1,423 @@
+"""Local snapshot of the wohnlagenadr2024 address layer.
+
+The snapshot is split into one partition per district. A refresh fetches
+every district, hashes its rows and only rewrites the partitions whose hash
+changed; unchanged partitions are hard-linked from the previous version.
+Every version also gets the whole table as one binary file (see
+address_table.save_address_table) that workers memory-map read-only.
+The new version becomes active by atomically replacing the CURRENT file, so
+running workers pick it up on their next check without a restart.
+
+Usage (from the project root, e.g. from cron):
+    python -m components.address_store
+
+Exits with status 1 if any district could not be fetched.
+"""
+
+import fcntl
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from components.wfs import BERLIN_DISTRICTS, WFS_GEOMETRY, WFSError, get_features
+
+STORE_DIR = "data/address_store"
+CURRENT_FILE = os.path.join(STORE_DIR, "CURRENT")
+LOCK_FILE = os.path.join(STORE_DIR, "LOCK")
+KEEP_VERSIONS = 3
+
+# How often a worker looks for a new version, in seconds
+CHECK_INTERVAL = 10
+# Seconds before a failed SnapshotValue build is tried again
+RETRY_INTERVAL = 60
+
+# Fields of the layer a row is built from
+ROW_PROPERTIES = ["strasse", "hnr", "plz", "wol", "stadtteil", WFS_GEOMETRY]
+
+logger = logging.getLogger(__name__)
+
+
+def partition_file(district):
+    return district.lower().replace("ö", "oe").replace(" ", "-") + ".json.gz"
+
+
+def fetch_district_rows(district):
+    rows = []
+    features = get_features(
+        f"bezname='{district}'", property_names=ROW_PROPERTIES, srs_name="EPSG:4326"
+    )
+    for feature in features:
+        props = feature.get("properties", {})
+        geometry = feature.get("geometry") or {}
+        if not geometry:
+            # Most likely WFS_GEOMETRY no longer names the geometry.
+            raise WFSError(f"Address in {district} without geometry")
+
+        coordinates = geometry.get("coordinates") or [None, None]
+        if geometry.get("type") == "MultiPoint":
+            coordinates = coordinates[0]
+
+        rows.append(
+            [
+                props.get("strasse"),
+                props.get("hnr"),
+                props.get("plz"),
+                (props.get("wol") or "").lower() or None,
+                (props.get("stadtteil") or "").lower() or None,
+                coordinates[0],
+                coordinates[1],
+            ]
+        )
+
+    # The service does not guarantee an order, sort so the hash is stable.
+    rows.sort(key=lambda row: json.dumps(row))
+    return rows
+
+
+def hash_rows(rows):
+    return hashlib.sha256(
+        json.dumps(rows, separators=(",", ":")).encode("utf-8")
+    ).hexdigest()
+
+
+def count_by_quality(rows):
+    counts = defaultdict(Counter)
+    for _, _, _, wol, stadtteil, _, _ in rows:
+        if wol and stadtteil:
+            counts[wol][stadtteil] += 1
+    return {wol: dict(counter) for wol, counter in counts.items()}
+
+
+def read_current_version():
+    try:
+        with open(CURRENT_FILE, encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load_manifest(version):
+    path = os.path.join(STORE_DIR, version, "manifest.json")
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def refresh_store():
+    """Fetch all districts and swap in a new version if anything changed.
+
+    Returns (districts whose partition was rewritten, districts that could
+    not be fetched and kept their previous rows). Only one refresh runs at a
+    time, while another one holds LOCK_FILE nothing is fetched and both
+    lists are empty.
+    """
+    os.makedirs(STORE_DIR, exist_ok=True)
+    with open(LOCK_FILE, "w", encoding="utf-8") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.warning("Another refresh is running, skipping this one")
+            return [], []
+        return write_new_version()
+
+
+def write_new_version():
+    previous_version = read_current_version()
+    previous = load_manifest(previous_version) if previous_version else None
+    previous_checked_at = snapshot_checked_at()
+
+    # Microseconds, so two refreshes within one second get distinct versions.
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    version_dir = os.path.join(STORE_DIR, version)
+    os.makedirs(version_dir)
+
+    partitions = {}
+    changed = []
+    failed = []
+    try:
+        for district in BERLIN_DISTRICTS:
+            old = previous["partitions"].get(district) if previous else None
+            path = os.path.join(version_dir, partition_file(district))
+
+            try:
+                rows = fetch_district_rows(district)
+            except Exception:
+                if old is None:
+                    raise
+                # Keep serving the last known rows for this district.
+                logger.warning("Could not fetch %s, keeping previous rows", district)
+                failed.append(district)
+                rows = None
+
+            rows_hash = hash_rows(rows) if rows is not None else None
+            if old is not None and rows_hash in (None, old["hash"]):
+                link_or_copy(
+                    os.path.join(STORE_DIR, previous_version, old["file"]), path
+                )
+                partitions[district] = old
+                continue
+
+            with gzip.open(path, "wt", encoding="utf-8") as f:
+                json.dump(rows, f, separators=(",", ":"))
+
+            partitions[district] = {
+                "file": partition_file(district),
+                "hash": rows_hash,
+                "rows": len(rows),
+                "counts": count_by_quality(rows),
+            }
+            changed.append(district)
+    except Exception:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+
+    # Lazy import, address_table builds on this module.
+    from components.address_table import write_table_file
+
+    if not changed:
+        shutil.rmtree(version_dir)
+        # Versions written before the table file existed get one now.
+        write_table_file(previous_version, previous)
+        if not failed:
+            # The snapshot is still up to date, see snapshot_checked_at.
+            os.utime(CURRENT_FILE)
+        return changed, failed
+
+    manifest = {"version": version, "partitions": partitions}
+    try:
+        write_table_file(version, manifest)
+    except Exception:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+
+    with open(os.path.join(version_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+
+    # os.replace is atomic, readers see either the old or the new version.
+    tmp_file = CURRENT_FILE + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_file, CURRENT_FILE)
+    if failed:
+        # The kept districts were last confirmed by an earlier refresh.
+        os.utime(CURRENT_FILE, (previous_checked_at, previous_checked_at))
+
+    remove_old_versions(version)
+    return changed, failed
+
+
+def link_or_copy(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def remove_old_versions(current):
+    versions = sorted(
+        name
+        for name in os.listdir(STORE_DIR)
+        if os.path.isdir(os.path.join(STORE_DIR, name))
+    )
+    for name in versions[:-KEEP_VERSIONS]:
+        if name != current:
+            shutil.rmtree(os.path.join(STORE_DIR, name), ignore_errors=True)
+
+
+_checked_at = 0.0
+_snapshot = (None, None)
+_snapshot_lock = threading.Lock()
+
+
+def current_snapshot():
+    """(version, manifest) of the active snapshot, (None, None) without one."""
+    global _checked_at, _snapshot
+
+    now = time.monotonic()
+    if now - _checked_at >= CHECK_INTERVAL:
+        with _snapshot_lock:
+            if now - _checked_at >= CHECK_INTERVAL:
+                version = read_current_version()
+                if version != _snapshot[0]:
+                    _snapshot = (version, load_manifest(version) if version else None)
+                _checked_at = now
+
+    return _snapshot
+
+
+def current_version():
+    return current_snapshot()[0]
+
+
+def snapshot_checked_at():
+    """When the active snapshot was last confirmed against the WFS, or None."""
+    try:
+        return os.path.getmtime(CURRENT_FILE)
+    except FileNotFoundError:
+        return None
+
+
+def get_snapshot_counts(district):
+    """{wol: {stadtteil: count}} from the snapshot, or None without one."""
+    version, manifest = current_snapshot()
+    if version is None:
+        return None
+
+    partition = manifest["partitions"].get(district)
+    return partition["counts"] if partition else None
+
+
+def iter_rows(version=None, manifest=None):
+    """(district, row) for every address of a version, by default the active one."""
+    if version is None:
+        version, manifest = current_snapshot()
+
+    for district, partition in manifest["partitions"].items():
+        path = os.path.join(STORE_DIR, version, partition["file"])
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for row in json.load(f):
+                yield district, row
+
+
+class SnapshotValue:
+    """Value built from the snapshot, rebuilt when a new version is active.
+
+    While one thread rebuilds, the others keep using the previous value. If
+    a build fails the previous value is kept, and the build is only tried
+    again after RETRY_INTERVAL; without a previous value the error is raised.
+
+    With a source, e.g. get_address_table, the value is built from what the
+    source returns and rebuilt when that changes, instead of following the
+    snapshot version. A value built on top of another one therefore always
+    matches the data it was built from.
+
+    Without a snapshot the value comes straight from the WFS. With max_age
+    it is then rebuilt in a background thread once it is older than
+    max_age seconds, meanwhile the old value is used.
+    """
+
+    def __init__(self, build, source=None, max_age=None):
+        self._build = build
+        self._source = source
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._value = None
+        self._version = None
+        # (time, version, error) of the last failed build
+        self._failure = None
+        self.built_at = None
+
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        self._refreshed_at = float("-inf")
+
+    def _backing_off(self, version):
+        failure = self._failure
+        return (
+            failure is not None
+            and failure[1] == version
+            and time.monotonic() - failure[0] < RETRY_INTERVAL
+        )
+
+    def _check_failure(self, version):
+        if self._value is None and self._backing_off(version):
+            raise self._failure[2].with_traceback(None)
+
+    def get(self):
+        version = current_version() if self._source is None else self._source()
+        if self._value is not None and self._version == version:
+            if version is None and self._max_age is not None:
+                self._revalidate()
+            return self._value
+
+        self._check_failure(version)
+        if self._backing_off(version):
+            return self._value
+
+        if self._lock.acquire(blocking=self._value is None):
+            try:
+                self._check_failure(version)
+                if (self._value is None or self._version != version) and not (
+                    self._backing_off(version)
+                ):
+                    self._rebuild(version)
+            finally:
+                self._lock.release()
+
+        return self._value
+
+    def get_nowait(self):
+        """Like get, but never waits and never raises.
+
+        Building and rebuilding happens in a background thread, meanwhile
+        the current value is returned, None before the first build is done.
+        """
+        now = time.monotonic()
+        with self._refresh_lock:
+            if not self._refreshing and now - self._refreshed_at >= CHECK_INTERVAL:
+                self._refreshing = True
+                self._refreshed_at = now
+                threading.Thread(target=self._refresh, daemon=True).start()
+
+        return self._value
+
+    def _refresh(self):
+        try:
+            self.get()
+        except Exception:
+            logger.warning("Background build failed", exc_info=True)
+        finally:
+            self._refreshing = False
+
+    def _revalidate(self):
+        if time.time() - self.built_at < self._max_age or self._backing_off(None):
+            return
+
+        with self._refresh_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._rebuild_stale, daemon=True).start()
+
+    def _rebuild_stale(self):
+        try:
+            with self._lock:
+                # A snapshot may have appeared in the meantime, get handles it.
+                if self._version is None:
+                    self._rebuild(None)
+        finally:
+            self._refreshing = False
+
+    def _rebuild(self, version):
+        try:
+            value = self._build() if self._source is None else self._build(version)
+        except Exception as error:
+            self._failure = (time.monotonic(), version, error)
+            if self._value is None:
+                raise
+            logger.warning("Rebuild failed, keeping the previous value", exc_info=True)
+            return
+
+        self._value = value
+        self._version = version
+        self._failure = None
+        self.built_at = time.time()
+
+    def peek(self):
+        return self._value
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    changed, failed = refresh_store()
+    print(f"Changed partitions: {', '.join(changed) if changed else 'none'}")
+    if failed:
+        print(f"Could not fetch: {', '.join(failed)}")
+        sys.exit(1)
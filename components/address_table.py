@@ -0,0 +1,301 @@
+import json
+import mmap
+import os
+import re
+
+from components.address_store import (
+    STORE_DIR,
+    SnapshotValue,
+    current_version,
+    fetch_district_rows,
+    iter_rows,
+)
+from components.mietspiegel import QUALITIES, STADTTEILE
+from components.wfs import BERLIN_DISTRICTS, CACHE_MAX_AGE
+
+# Code of a missing wol or stadtteil in the uint8 columns
+UNKNOWN = 255
+
+TABLE_FILE = "addresses.bin"
+TABLE_MAGIC = b"MSADDR01"
+# Column offsets in the file are aligned to this many bytes
+ALIGNMENT = 64
+
+
+def make_key(street_id, postcode, number, suffix_id):
+    # street (23 bits) | postcode (17 bits) | number (16 bits) | suffix (8 bits),
+    # which sorts exactly like the rows of the table.
+    return street_id << 41 | postcode << 24 | number << 8 | suffix_id
+
+
+def split_house_number(house_number):
+    """("012 a") -> (12, "A"), or None if there is no number."""
+    match = re.fullmatch(r"0*(\d+)\s*(.*)", str(house_number).strip())
+    if match is None:
+        return None
+    return int(match.group(1)), match.group(2).replace(" ", "").upper()
+
+
+def format_house_number(number, suffix):
+    return f"{number}{suffix}"
+
+
+class AddressTable:
+    """All addresses of the Wohnlagen layer as parallel NumPy columns.
+
+    Street names and house number suffixes are interned, the columns only
+    hold their ids. Rows are sorted by street, postcode, house number and
+    suffix, so all addresses of a street are one contiguous slice and the
+    uint64 key column is a sorted index for exact address lookups.
+
+    Saved with save_address_table, the columns can be memory-mapped by every
+    worker, so a host keeps a single copy in its page cache.
+    """
+
+    __slots__ = (
+        "streets",
+        "suffixes",
+        "street",
+        "number",
+        "suffix",
+        "postcode",
+        "wol",
+        "stadtteil",
+        "district",
+        "lon",
+        "lat",
+        "key",
+        "grid_cell",
+        "grid_order",
+    )
+
+    def __init__(self, streets, suffixes, columns):
+        self.streets = streets
+        self.suffixes = suffixes
+
+        self.street = columns["street"]  # uint32 id into streets
+        self.number = columns["number"]  # uint16
+        self.suffix = columns["suffix"]  # uint8 id into suffixes
+        self.postcode = columns["postcode"]  # uint32
+        self.wol = columns["wol"]  # uint8 index into QUALITIES
+        self.stadtteil = columns["stadtteil"]  # uint8 index into STADTTEILE
+        self.district = columns["district"]  # uint8 index into BERLIN_DISTRICTS
+        self.lon = columns["lon"]  # float32
+        self.lat = columns["lat"]  # float32
+        self.key = columns["key"]  # uint64, see make_key
+
+        # Precomputed spatial grid, see spatial_index.compute_grid
+        self.grid_cell = columns.get("grid_cell")
+        self.grid_order = columns.get("grid_order")
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build the table from (district, row) pairs of the address store."""
+        import numpy as np
+
+        parsed = []
+        for district, row in rows:
+            street, house_number, postcode, wol, stadtteil, lon, lat = row
+
+            house_number = split_house_number(house_number or "")
+            if not street or house_number is None:
+                continue
+            if not str(postcode or "").isdigit():
+                continue
+
+            parsed.append(
+                (
+                    street,
+                    house_number[0],
+                    house_number[1],
+                    int(postcode),
+                    QUALITIES.index(wol) if wol in QUALITIES else UNKNOWN,
+                    (
+                        STADTTEILE.index(stadtteil)
+                        if stadtteil in STADTTEILE
+                        else UNKNOWN
+                    ),
+                    BERLIN_DISTRICTS.index(district),
+                    np.nan if lon is None else lon,
+                    np.nan if lat is None else lat,
+                )
+            )
+
+        # Sorted interned strings, so comparing ids is comparing strings.
+        streets = sorted({row[0] for row in parsed})
+        suffixes = sorted({row[2] for row in parsed} | {""})
+        street_ids = {street: i for i, street in enumerate(streets)}
+        suffix_ids = {suffix: i for i, suffix in enumerate(suffixes)}
+
+        def column(values, dtype):
+            return np.fromiter(values, dtype=dtype, count=len(parsed))
+
+        columns = {
+            "street": column((street_ids[row[0]] for row in parsed), np.uint32),
+            "number": column((row[1] for row in parsed), np.uint16),
+            "suffix": column((suffix_ids[row[2]] for row in parsed), np.uint8),
+            "postcode": column((row[3] for row in parsed), np.uint32),
+            "wol": column((row[4] for row in parsed), np.uint8),
+            "stadtteil": column((row[5] for row in parsed), np.uint8),
+            "district": column((row[6] for row in parsed), np.uint8),
+            "lon": column((row[7] for row in parsed), np.float32),
+            "lat": column((row[8] for row in parsed), np.float32),
+        }
+
+        # Sort by street, then postcode, house number and suffix
+        order = np.lexsort(
+            (
+                columns["suffix"],
+                columns["number"],
+                columns["postcode"],
+                columns["street"],
+            )
+        )
+        columns = {name: column[order] for name, column in columns.items()}
+        columns["key"] = make_key(
+            columns["street"].astype(np.uint64),
+            columns["postcode"].astype(np.uint64),
+            columns["number"].astype(np.uint64),
+            columns["suffix"].astype(np.uint64),
+        )
+
+        return cls(streets, suffixes, columns)
+
+    def __len__(self):
+        return len(self.street)
+
+    def columns(self):
+        return {
+            name: getattr(self, name)
+            for name in self.__slots__
+            if name not in ("streets", "suffixes") and getattr(self, name) is not None
+        }
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns().values())
+
+    def street_range(self, street_id):
+        # Search with the column's own dtype, a Python int would make NumPy
+        # cast (and copy) the whole column first.
+        street_id = self.street.dtype.type(street_id)
+        start = int(self.street.searchsorted(street_id, side="left"))
+        end = int(self.street.searchsorted(street_id, side="right"))
+        return start, end
+
+    def suffix_id(self, suffix):
+        try:
+            return self.suffixes.index(suffix)
+        except ValueError:
+            return None
+
+    def find(self, street_id, postcode, number, suffix_id):
+        """Row of an address, or None."""
+        key = self.key.dtype.type(make_key(street_id, postcode, number, suffix_id))
+        i = int(self.key.searchsorted(key))
+        if i < len(self.key) and self.key[i] == key:
+            return i
+        return None
+
+
+def save_address_table(table, path):
+    """Write the table as one binary file that open_address_table can map.
+
+    Layout: magic, uint64 header length, JSON header with string tables and
+    column offsets, then every column as raw little-endian values.
+    """
+    columns = table.columns()
+
+    header = {"rows": len(table), "streets": table.streets, "suffixes": table.suffixes}
+    header_size = 0
+    # The offsets depend on the header size, so size the header until stable.
+    # Larger offsets never make the header shorter, so this ends.
+    while True:
+        offset = len(TABLE_MAGIC) + 8 + header_size
+        header["columns"] = {}
+        for name, column in columns.items():
+            offset += -offset % ALIGNMENT
+            header["columns"][name] = {
+                "dtype": column.dtype.str,
+                "offset": offset,
+                "length": len(column),
+            }
+            offset += column.nbytes
+        header_bytes = json.dumps(header).encode("utf-8")
+        if len(header_bytes) == header_size:
+            break
+        header_size = len(header_bytes)
+
+    with open(path, "wb") as f:
+        f.write(TABLE_MAGIC)
+        f.write(len(header_bytes).to_bytes(8, "little"))
+        f.write(header_bytes)
+        for name, column in columns.items():
+            offset = header["columns"][name]["offset"]
+            f.write(b"\0" * (offset - f.tell()))
+            if f.tell() != offset:
+                raise ValueError(f"Column {name} would not start at offset {offset}")
+            f.write(column.astype(column.dtype.newbyteorder("<"), copy=False).tobytes())
+
+
+def open_address_table(path):
+    """Map a saved table read-only; the columns are views into the mapping."""
+    import numpy as np
+
+    with open(path, "rb") as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mapping[: len(TABLE_MAGIC)] != TABLE_MAGIC:
+        raise ValueError(f"{path} is not an address table")
+
+    start = len(TABLE_MAGIC) + 8
+    header_length = int.from_bytes(mapping[len(TABLE_MAGIC) : start], "little")
+    header = json.loads(mapping[start : start + header_length])
+
+    columns = {
+        name: np.frombuffer(
+            mapping, dtype=column["dtype"], count=column["length"], offset=column["offset"]
+        )
+        for name, column in header["columns"].items()
+    }
+
+    return AddressTable(header["streets"], header["suffixes"], columns)
+
+
+def write_table_file(version, manifest):
+    """Build the table of a store version and save it next to its partitions."""
+    # Lazy import, the spatial index is built on top of this module.
+    from components.spatial_index import compute_grid
+
+    path = os.path.join(STORE_DIR, version, TABLE_FILE)
+    if os.path.exists(path):
+        return
+
+    table = AddressTable.from_rows(iter_rows(version, manifest))
+    table.grid_cell, table.grid_order = compute_grid(table)
+
+    save_address_table(table, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def load_address_table():
+    version = current_version()
+    if version is not None:
+        path = os.path.join(STORE_DIR, version, TABLE_FILE)
+        if os.path.exists(path):
+            # Only maps the file, the pages are shared by all workers.
+            return open_address_table(path)
+        return AddressTable.from_rows(iter_rows())
+
+    return AddressTable.from_rows(
+        (district, row)
+        for district in BERLIN_DISTRICTS
+        for row in fetch_district_rows(district)
+    )
+
+
+_address_table = SnapshotValue(load_address_table, max_age=CACHE_MAX_AGE)
+
+
+def get_address_table():
+    return _address_table.get()
@@ -0,0 +1,135 @@
+"""Stale-while-revalidate cache for functions backed by the WFS.
+
+Once a value has been fetched it is always answered from the cache. When it
+is older than max_age, the caller still gets the old value right away and a
+background thread fetches a new one. If that fails the old value is kept.
+A failed first fetch is remembered too and raised again without calling
+the WFS until retry_interval has passed, so an unavailable WFS costs at
+most one timeout per key and interval.
+"""
+
+import functools
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def stale_while_revalidate(max_age, maxsize=128, retry_interval=60):
+    """Like lru_cache(maxsize), but refreshes entries older than max_age seconds.
+
+    After a failed fetch or refresh the next one is tried retry_interval
+    seconds later; until then a key without a value raises the last error.
+
+    The wrapped function gets fetched_at(*args), the time its cached value
+    was fetched (or None), and cache_clear().
+    """
+
+    def decorator(function):
+        # args -> (value, fetched_at), least recently used first
+        entries = OrderedDict()
+        refreshing = set()
+        # args -> (time, error) of the last failed fetch or refresh
+        failed = {}
+        lock = threading.Lock()
+
+        def store(args, value):
+            with lock:
+                entries[args] = (value, time.time())
+                entries.move_to_end(args)
+                while len(entries) > maxsize:
+                    evicted, _ = entries.popitem(last=False)
+                    failed.pop(evicted, None)
+
+        def refresh(args):
+            try:
+                store(args, function(*args))
+                with lock:
+                    failed.pop(args, None)
+            except Exception as error:
+                with lock:
+                    failed[args] = (time.time(), error)
+                logger.warning(
+                    "Refreshing %s%r failed, keeping the stale value",
+                    function.__name__,
+                    args,
+                    exc_info=True,
+                )
+            finally:
+                with lock:
+                    refreshing.discard(args)
+
+        @functools.wraps(function)
+        def wrapper(*args):
+            with lock:
+                entry = entries.get(args)
+                if entry is not None:
+                    entries.move_to_end(args)
+                    now = time.time()
+                    if (
+                        now - entry[1] >= max_age
+                        and now - failed.get(args, (0, None))[0] >= retry_interval
+                        and args not in refreshing
+                    ):
+                        refreshing.add(args)
+                        threading.Thread(
+                            target=refresh, args=(args,), daemon=True
+                        ).start()
+
+            if entry is not None:
+                return entry[0]
+
+            with lock:
+                failure = failed.get(args)
+            if failure is not None and time.time() - failure[0] < retry_interval:
+                raise failure[1].with_traceback(None)
+
+            try:
+                value = function(*args)
+            except Exception as error:
+                with lock:
+                    failed[args] = (time.time(), error)
+                    forget_old_failures()
+                raise
+
+            store(args, value)
+            with lock:
+                failed.pop(args, None)
+            return value
+
+        def forget_old_failures():
+            # Keys that never got a value are not evicted with the entries.
+            if len(failed) > maxsize:
+                now = time.time()
+                for key, (failed_at, _) in list(failed.items()):
+                    if now - failed_at >= retry_interval:
+                        del failed[key]
+
+        def fetched_at(*args):
+            entry = entries.get(args)
+            return None if entry is None else entry[1]
+
+        def cache_clear():
+            with lock:
+                entries.clear()
+                failed.clear()
+
+        wrapper.fetched_at = fetched_at
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    return decorator
+
+
+def format_age(timestamp):
+    """ "5 minutes ago" for a time.time() timestamp."""
+    seconds = max(0, time.time() - timestamp)
+
+    for unit, length in (("day", 86400), ("hour", 3600), ("minute", 60)):
+        if seconds >= length:
+            count = int(seconds // length)
+            return f"{count} {unit}{'s' if count > 1 else ''} ago"
+
+    return "just now"
@@ -1,122 +1,149 @@
-from dash import Dash, html, dcc, callback, Output, Input
+from dash import Dash, html, dcc, callback, no_update, Output, Input
 import dash_mantine_components as dmc
 from dash_iconify import DashIconify
 from datetime import datetime, timedelta
 from dash.exceptions import PreventUpdate
-import requests
-import pandas as pd
-
-calculator_layout = dmc.Group(
-    [
-        html.Div(
-            [
-                dmc.Title("Check Your Rental Offer", order=5, mb=12),
-                dmc.Text("Adress"),
-                dmc.TextInput(
-                    id="street-input",
-                    placeholder="e.g. Torstraße",
-                    description="Enter the address of a rental, including street name, house number and postcode",
-                    radius="md",
-                    variant="default",
-                    required=True,
-                    mb=10,
-                ),
-                dmc.TextInput(
-                    id="house-input",
-                    placeholder="e.g. 101",
-                    radius="md",
-                    variant="default",
-                    required=True,
-                    mb=10,
-                ),
-                dmc.TextInput(
-                    id="postcode-input",
-                    placeholder="e.g. 10119",
-                    radius="md",
-                    variant="default",
-                    required=True,
-                    mb=30,
-                ),
-                dmc.Text("Apartment Size (m²)"),
-                dmc.Slider(
-                    id="slider-apartment-size",
-                    value=50,
-                    max=120,
-                    color="#384B70",
-                    size="lg",
-                    marks=[
-                        {"value": 20, "label": "20"},
-                        {"value": 50, "label": "50"},
-                        {"value": 80, "label": "80"},
-                        {"value": 120, "label": "120+"},
-                    ],
-                    mt=30,
-                    mb=40,
-                ),
-                dmc.Text("Construction Year", mb=12),
-                dmc.YearPickerInput(
-                    id="construction-year-input",
-                    leftSection=DashIconify(icon="fa:calendar"),
-                    leftSectionPointerEvents="none",
-                    minDate=datetime(1800, 1, 1),
-                    maxDate=datetime(2022, 1, 1),
-                    value=datetime(1960, 1, 1),
-                    w=200,
-                    mb=30,
-                ),
-                dmc.Text("Offered Rent (€ per month)", mb=12),
-                dmc.TextInput(
-                    id="offered-rent-input",
-                    placeholder="e.g. 850",
-                    description="Total cold rent (Kaltmiete)",
-                    radius="md",
-                    variant="default",
-                    required=True,
-                    mb=30,
-                ),
-            ],
-            style={
-                "height": 620,
-                "width": 400,
-                "background": "#FCFAEE",
-                "padding": 20,
-                "border-radius": 20,
-                "border": "2px solid #384B70",
-            },
-        ),
-        html.Div(
-            id="calculator-container",
-            children=[
-                dmc.Button(
-                    "Calculate Comparison",
-                    id="calculate-comparison-button",
-                    variant="default",
-                    color="#384B70",
-                    size="md",
-                    radius="md",
-                    loading=False,
-                    disabled=False,
-                    leftSection=DashIconify(
-                        icon="twemoji:magnifying-glass-tilted-left"
-                    ),
-                ),
-                html.Div(id="body-div"),
-            ],
-            style={
-                "height": 620,
-                "width": 500,
-                "background": "#FCFAEE",
-                "border-radius": 20,
-                "display": "flex",
-                "flexDirection": "column",
-                "justifyContent": "center",
-                "alignItems": "center",
-                "border": "2px solid #384B70",
-                "padding": "20px",
-            },
-        ),
-    ]
+from functools import lru_cache
+from components.mietspiegel import (
+    QUALITY_LABELS,
+    STADTTEILE,
+    find_cell,
+    get_year_bucket,
 )
+from components.editions import get_cell_trend
+from components.wfs import CACHE_MAX_AGE, WFSError, get_features
+from components.cache import format_age, stale_while_revalidate
+from components.profiling import profiled
+from components.address_index import (
+    address_data_time,
+    canonicalize_address,
+    normalize_house_number,
+    peek_address_index,
+)
+from urllib.parse import parse_qs, urlencode
+
+
+# The layout is only built the first time the tab is opened, so importing
+# this module to register callbacks stays cheap at startup.
+@lru_cache(maxsize=1)
+def get_calculator_layout():
+    return dmc.Group(
+        [
+            html.Div(
+                [
+                    dmc.Title("Check Your Rental Offer", order=5, mb=12),
+                    dmc.Text("Adress"),
+                    dmc.Autocomplete(
+                        id="street-input",
+                        data=[],
+                        filter={"function": "keepServerSuggestions"},
+                        debounce=150,
+                        placeholder="e.g. Torstraße",
+                        description="Enter the address of a rental, including street name, house number and postcode",
+                        radius="md",
+                        variant="default",
+                        required=True,
+                        mb=10,
+                    ),
+                    dmc.Autocomplete(
+                        id="house-input",
+                        data=[],
+                        placeholder="e.g. 101",
+                        radius="md",
+                        variant="default",
+                        required=True,
+                        mb=10,
+                    ),
+                    dmc.Autocomplete(
+                        id="postcode-input",
+                        data=[],
+                        placeholder="e.g. 10119",
+                        radius="md",
+                        variant="default",
+                        required=True,
+                        mb=30,
+                    ),
+                    dmc.Text("Apartment Size (m²)"),
+                    dmc.Slider(
+                        id="slider-apartment-size",
+                        value=50,
+                        max=120,
+                        color="#384B70",
+                        size="lg",
+                        marks=[
+                            {"value": 20, "label": "20"},
+                            {"value": 50, "label": "50"},
+                            {"value": 80, "label": "80"},
+                            {"value": 120, "label": "120+"},
+                        ],
+                        mt=30,
+                        mb=40,
+                    ),
+                    dmc.Text("Construction Year", mb=12),
+                    dmc.YearPickerInput(
+                        id="construction-year-input",
+                        leftSection=DashIconify(icon="fa:calendar"),
+                        leftSectionPointerEvents="none",
+                        minDate=datetime(1800, 1, 1),
+                        maxDate=datetime(2022, 1, 1),
+                        value=datetime(1960, 1, 1),
+                        w=200,
+                        mb=30,
+                    ),
+                    dmc.Text("Offered Rent (€ per month)", mb=12),
+                    dmc.TextInput(
+                        id="offered-rent-input",
+                        placeholder="e.g. 850",
+                        description="Total cold rent (Kaltmiete)",
+                        radius="md",
+                        variant="default",
+                        required=True,
+                        mb=30,
+                    ),
+                ],
+                style={
+                    "height": 620,
+                    "width": 400,
+                    "background": "#FCFAEE",
+                    "padding": 20,
+                    "border-radius": 20,
+                    "border": "2px solid #384B70",
+                },
+            ),
+            html.Div(
+                id="calculator-container",
+                children=[
+                    dmc.Button(
+                        "Calculate Comparison",
+                        id="calculate-comparison-button",
+                        variant="default",
+                        color="#384B70",
+                        size="md",
+                        radius="md",
+                        loading=False,
+                        disabled=False,
+                        leftSection=DashIconify(
+                            icon="twemoji:magnifying-glass-tilted-left"
+                        ),
+                    ),
+                    html.Div(id="body-div"),
+                    dcc.Location(id="calculator-url", refresh=False),
+                ],
+                style={
+                    "height": 620,
+                    "width": 500,
+                    "background": "#FCFAEE",
+                    "border-radius": 20,
+                    "display": "flex",
+                    "flexDirection": "column",
+                    "justifyContent": "center",
+                    "alignItems": "center",
+                    "border": "2px solid #384B70",
+                    "padding": "20px",
+                },
+            ),
+        ]
+    )
 
 
 def compare_to_mean_rent(
@@ -142,98 +169,240 @@ def compare_to_mean_rent(
     if location_quality is None:
         return None
 
-    csv_path = "data/csv_files/2024converted.csv"
-    current_mietspiegel_table = pd.read_csv(csv_path)
+    # Anything but "einfach" and "mittel" is treated as a good location
+    if location_quality not in ("einfach", "mittel"):
+        location_quality = "gut"
 
-    if location_quality == "einfach":
-        location_quality = "simple"
-        current_mietspiegel_table_cropped = current_mietspiegel_table.loc[0:48]
-    elif location_quality == "mittel":
-        location_quality = "medium"
-        current_mietspiegel_table_cropped = current_mietspiegel_table.loc[49:116]
-    else:
-        location_quality = "good"
-        current_mietspiegel_table_cropped = current_mietspiegel_table.loc[117:162]
+    cell = find_cell(location_quality, stadtteil, construction_year, apartment_size)
+    if cell is None:
+        return None
+
+    expected_lower = cell.lower * apartment_size
+    expected_mean = cell.mean * apartment_size
+    expected_upper = cell.upper * apartment_size
+
+    return {
+        "location_quality": QUALITY_LABELS[location_quality],
+        "lower_range_per_m2": cell.lower,
+        "mean_value_per_m2": cell.mean,
+        "upper_range_per_m2": cell.upper,
+        "difference_lower": round(
+            (offered_rent - expected_lower) / expected_lower * 100, 2
+        ),
+        "difference_mean": round(
+            (offered_rent - expected_mean) / expected_mean * 100, 2
+        ),
+        "difference_upper": round(
+            (offered_rent - expected_upper) / expected_upper * 100, 2
+        ),
+        # [(edition, mean value per m²)] of this cell across editions
+        "trend": get_cell_trend(cell.row, stadtteil) if stadtteil in STADTTEILE else [],
+    }
 
-    for _, row in current_mietspiegel_table_cropped.iterrows():
 
-        raw_year_cell = str(row["Construction year (max)"]).lower()
-        construction_year_integer = int(raw_year_cell[:4])
+def normalize_comparison_inputs(
+    street, house_number, postcode, apartment_size, construction_year, offered_rent
+):
+    """Cache key of a comparison, or None if the inputs are invalid.
+
+    The construction year is replaced by the table breakpoint it selects, so
+    e.g. 1950 and 1960 share one cache entry.
+    """
+    try:
+        offered_rent = round(float(str(offered_rent).replace(",", ".")), 2)
+        apartment_size = round(float(str(apartment_size).replace(",", ".")), 2)
+        construction_year = int(str(construction_year)[:4])
+    except (TypeError, ValueError):
+        return None
 
-        row_stadtteil = None
-        if "west" in raw_year_cell:
-            row_stadtteil = "west"
-        elif "ost" in raw_year_cell:
-            row_stadtteil = "ost"
+    postcode = str(postcode).strip()
+    house_number = normalize_house_number(house_number)
+    if house_number is None:
+        return None
 
-        if row_stadtteil is not None and row_stadtteil != stadtteil:
-            continue
+    street = canonicalize_address(str(street).strip(), house_number, postcode)
+    if street is None:
+        return None
+
+    return (
+        street,
+        house_number,
+        postcode,
+        apartment_size,
+        get_year_bucket(construction_year),
+        offered_rent,
+    )
+
+
+def render_comparison(key):
+    """Result view for a normalized comparison key, with the age of its data."""
+    if key is None:
+        return get_not_found_view()
 
-        apartment_size_integer = int(parse_number(row["Living area (max)"]))
-        if (
-            construction_year <= construction_year_integer
-            and apartment_size <= apartment_size_integer
-        ):
-            lower = float(str(row["Lower range"]).replace(",", "."))
-            mean = float(str(row["Mean value"]).replace(",", "."))
-            upper = float(str(row["Upper range"]).replace(",", "."))
-
-            expected_lower = lower * apartment_size
-            expected_mean = mean * apartment_size
-            expected_upper = upper * apartment_size
-
-            return {
-                "location_quality": location_quality,
-                "lower_range_per_m2": lower,
-                "mean_value_per_m2": mean,
-                "upper_range_per_m2": upper,
-                "difference_lower": round(
-                    (offered_rent - expected_lower) / expected_lower * 100, 2
-                ),
-                "difference_mean": round(
-                    (offered_rent - expected_mean) / expected_mean * 100, 2
-                ),
-                "difference_upper": round(
-                    (offered_rent - expected_upper) / expected_upper * 100, 2
-                ),
-            }
-
-    return None
-
-
-def parse_number(s):
-    if s is None:
-        return 0.0
-    s = str(s).replace("\xa0", "")
-    s = s.replace(",", ".")
     try:
-        return float(s)
-    except ValueError:
-        return 0.0
+        # Load the location data first, so the view cache is keyed on the
+        # time of the data it is rendered from.
+        get_location_data(*key[:3])
+        fetched_at = get_location_data_time(*key[:3])
+        view = get_comparison_view(*key, fetched_at)
+    except WFSError:
+        return get_unavailable_view()
+
+    return html.Div([view, get_data_age_note(fetched_at)])
+
+
+@lru_cache(maxsize=4096)
+def get_comparison_view(
+    street,
+    house_number,
+    postcode,
+    apartment_size,
+    construction_year,
+    offered_rent,
+    fetched_at=None,
+):
+    # fetched_at only takes part in the cache key, see render_comparison.
+    result = compare_to_mean_rent(
+        street,
+        house_number,
+        postcode,
+        apartment_size,
+        construction_year,
+        offered_rent,
+    )
+    if result is None:
+        return get_not_found_view()
+
+    difference_mean = result["difference_mean"]
+
+    if difference_mean > 0:
+        headline = f"{difference_mean}% more expensive than average"
+    elif difference_mean < 0:
+        headline = f"{abs(difference_mean)}% cheaper than average"
+    else:
+        headline = "Exactly the average rent"
+
+    share_query = urlencode(
+        {
+            "street": street,
+            "house": house_number,
+            "postcode": postcode,
+            "size": apartment_size,
+            "year": construction_year,
+            "rent": offered_rent,
+        }
+    )
+
+    return html.Div(
+        [
+            html.H3(f"Location quality: {result['location_quality']}"),
+            html.H3(headline),
+            html.Hr(),
+            html.P(
+                f"Lower range: {result['lower_range_per_m2']} €/m² "
+                f"({result['difference_lower']}%)"
+            ),
+            html.P(
+                f"Mean value: {result['mean_value_per_m2']} €/m² "
+                f"({result['difference_mean']}%)"
+            ),
+            html.P(
+                f"Upper range: {result['upper_range_per_m2']} €/m² "
+                f"({result['difference_upper']}%)"
+            ),
+            get_trend_note(result["trend"]),
+            html.Hr(),
+            dmc.Anchor("Link to this result", href=f"/?{share_query}", c="#384B70"),
+            html.Br(),
+            dmc.Button(
+                "Calculate comparison again",
+                id="calculate-again-button",
+                variant="default",
+                color="#384B70",
+                size="md",
+                radius="md",
+                mt=20,
+            ),
+        ]
+    )
+
+
+def get_trend_note(trend):
+    # Only shown once more than one edition of the Mietspiegel is available.
+    if len(trend) < 2:
+        return None
+    return html.P(
+        "Mean value by edition: "
+        + ", ".join(f"{edition}: {mean} €/m²" for edition, mean in trend)
+    )
+
+
+def get_not_found_view():
+    return get_message_view("No Mietspiegel data found for this address")
+
+
+def get_unavailable_view():
+    return get_message_view(
+        "The address data service is not reachable right now, please try again later"
+    )
+
+
+def get_message_view(message):
+    return html.Div(
+        [
+            html.H3(message),
+            dmc.Button(
+                "Calculate comparison again",
+                id="calculate-again-button",
+                variant="default",
+                color="#384B70",
+                size="md",
+                radius="md",
+                mt=20,
+            ),
+        ]
+    )
+
+
+def get_data_age_note(fetched_at):
+    if fetched_at is None:
+        return None
+    return dmc.Text(
+        f"Address data updated {format_age(fetched_at)}", size="xs", c="dimmed", mt=10
+    )
 
 
 def get_location_data(street, house_number, postcode):
-    url = "https://gdi.berlin.de/services/wfs/wohnlagenadr2024"
+    index = peek_address_index()
+    if index is not None:
+        # The address table has wol and stadtteil of every address.
+        return index.location_data(street, house_number, postcode)
+
+    return fetch_location_data(street, house_number, postcode)
+
+
+def get_location_data_time(street, house_number, postcode):
+    """When the location data of an address was fetched, or None."""
+    if peek_address_index() is not None:
+        return address_data_time()
+    return fetch_location_data.fetched_at(street, house_number, postcode)
+
+
+@stale_while_revalidate(CACHE_MAX_AGE, maxsize=4096)
+def fetch_location_data(street, house_number, postcode):
+    street = canonicalize_address(street, house_number, postcode)
+    if street is None:
+        return None
 
     formatted_house_number = house_number.zfill(3)
 
     cql = f"strasse='{street}' AND hnr='{formatted_house_number}' AND plz='{postcode}'"
 
-    params = {
-        "SERVICE": "WFS",
-        "REQUEST": "GetFeature",
-        "VERSION": "1.1.0",
-        "TYPENAME": "wohnlagenadr2024:wohnlagenadr2024",
-        "OUTPUTFORMAT": "json",
-        "cql_filter": cql,
-    }
-
-    response = requests.get(url, params=params)
-    data = response.json()
+    features = get_features(cql)
 
-    if not data["features"]:
+    if not features:
         return None
-    feature = data["features"][0]
+    feature = features[0]
 
     properties = feature["properties"]
     wol = properties.get("wol")
@@ -261,6 +430,7 @@ def register_callbacks_calculator(app):
         ],
         prevent_initial_call=True,
     )
+    @profiled
     def update_output(
         n_clicks,
         street,
@@ -283,7 +453,7 @@ def register_callbacks_calculator(app):
             raise PreventUpdate
         else:
             hidden_style = {"display": "none"}
-            result = compare_to_mean_rent(
+            key = normalize_comparison_inputs(
                 street,
                 house_number,
                 postcode,
@@ -292,44 +462,57 @@ def register_callbacks_calculator(app):
                 offered_rent,
             )
 
-            difference_mean = result["difference_mean"]
+            return hidden_style, render_comparison(key)
 
-            if difference_mean > 0:
-                headline = f"{difference_mean}% more expensive than average"
-            elif difference_mean < 0:
-                headline = f"{abs(difference_mean)}% cheaper than average"
-            else:
-                headline = "Exactly the average rent"
+    @app.callback(
+        Output("street-input", "value"),
+        Output("house-input", "value"),
+        Output("postcode-input", "value"),
+        Output("slider-apartment-size", "value"),
+        Output("construction-year-input", "value"),
+        Output("offered-rent-input", "value"),
+        Output("calculate-comparison-button", "style", allow_duplicate=True),
+        Output("body-div", "children", allow_duplicate=True),
+        Input("calculator-url", "search"),
+        prevent_initial_call="initial_duplicate",
+    )
+    def load_shared_result(search):
+        params = parse_qs((search or "").lstrip("?"))
+        try:
+            street = params["street"][0]
+            house_number = params["house"][0]
+            postcode = params["postcode"][0]
+            apartment_size = params["size"][0]
+            construction_year = params["year"][0]
+            offered_rent = params["rent"][0]
+        except KeyError:
+            raise PreventUpdate
 
-            return hidden_style, html.Div(
-                [
-                    html.H3(f"Location quality: {result['location_quality']}"),
-                    html.H3(headline),
-                    html.Hr(),
-                    html.P(
-                        f"Lower range: {result['lower_range_per_m2']} €/m² "
-                        f"({result['difference_lower']}%)"
-                    ),
-                    html.P(
-                        f"Mean value: {result['mean_value_per_m2']} €/m² "
-                        f"({result['difference_mean']}%)"
-                    ),
-                    html.P(
-                        f"Upper range: {result['upper_range_per_m2']} €/m² "
-                        f"({result['difference_upper']}%)"
-                    ),
-                    html.Hr(),
-                    dmc.Button(
-                        "Calculate comparison again",
-                        id="calculate-again-button",
-                        variant="default",
-                        color="#384B70",
-                        size="md",
-                        radius="md",
-                        mt=20,
-                    ),
-                ]
-            )
+        key = normalize_comparison_inputs(
+            street,
+            house_number,
+            postcode,
+            apartment_size,
+            construction_year,
+            offered_rent,
+        )
+        if key is None:
+            # The raw values may not even be numbers, keep the form as it is.
+            return (no_update,) * 6 + ({"display": "none"}, get_not_found_view())
+
+        # Filled from the key, the raw values may use a decimal comma and
+        # any year selects the same cells as its breakpoint.
+        street, house_number, postcode, apartment_size, year_bucket, rent = key
+        return (
+            street,
+            house_number,
+            postcode,
+            apartment_size,
+            f"{year_bucket:04d}-01-01",
+            f"{rent:g}",
+            {"display": "none"},
+            render_comparison(key),
+        )
 
     @app.callback(
         Output("calculate-comparison-button", "style", allow_duplicate=True),
@@ -354,4 +537,52 @@ def register_callbacks_calculator(app):
         if not n_clicks_again:
             raise PreventUpdate
 
-        return None 
+        return None
+
+    @app.callback(
+        Output("street-input", "data"),
+        Input("street-input", "value"),
+        prevent_initial_call=True,
+    )
+    def suggest_streets(street):
+        if not street:
+            return []
+
+        # No suggestions until the index has been built in the background.
+        index = peek_address_index()
+        if index is None:
+            return []
+
+        return index.suggest_streets(street)
+
+    @app.callback(
+        Output("house-input", "data"),
+        Input("street-input", "value"),
+        Input("postcode-input", "value"),
+        prevent_initial_call=True,
+    )
+    def suggest_house_numbers(street, postcode):
+        if not street:
+            return []
+
+        index = peek_address_index()
+        if index is None:
+            return []
+
+        return index.house_numbers(street, postcode or None)
+
+    @app.callback(
+        Output("postcode-input", "data"),
+        Input("street-input", "value"),
+        Input("house-input", "value"),
+        prevent_initial_call=True,
+    )
+    def suggest_postcodes(street, house_number):
+        if not street:
+            return []
+
+        index = peek_address_index()
+        if index is None:
+            return []
+
+        return index.postcodes(street, house_number or None)
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+from dash import html, dcc, Output, Input, State, Patch
+from dash.exceptions import PreventUpdate
+import dash_mantine_components as dmc
+from flask import Response, abort, request
+
+GEOMETRY_DIR = "data/geometries"
+
+# Simplification tolerance in degrees per level of detail, and the map zoom
+# from which a level is used.
+GEOMETRY_LEVELS = {
+    "coarse": {"tolerance": 0.001, "min_zoom": 0},
+    "medium": {"tolerance": 0.0003, "min_zoom": 11},
+    "fine": {"tolerance": 0.00005, "min_zoom": 13},
+}
+
+BERLIN_CENTER = {"lat": 52.51, "lon": 13.40}
+
+
+def topology_path(level):
+    return os.path.join(GEOMETRY_DIR, f"districts_{level}.topojson")
+
+
+def geometry_url(level, geometry_format="geojson"):
+    return f"/api/geometries/districts/{level}.{geometry_format}"
+
+
+def level_for_zoom(zoom):
+    level = "coarse"
+    for name, settings in GEOMETRY_LEVELS.items():
+        if zoom is not None and zoom >= settings["min_zoom"]:
+            level = name
+    return level
+
+
+def geometries_available():
+    return all(os.path.exists(topology_path(level)) for level in GEOMETRY_LEVELS)
+
+
+@lru_cache(maxsize=len(GEOMETRY_LEVELS))
+def load_topology(level):
+    with open(topology_path(level), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def topology_to_geojson(topology, object_name="districts"):
+    import numpy as np
+
+    scale = np.array(topology["transform"]["scale"])
+    translate = np.array(topology["transform"]["translate"])
+
+    # Arcs are quantized and delta-encoded
+    arcs = [
+        (np.cumsum(np.array(arc), axis=0) * scale + translate).round(6).tolist()
+        for arc in topology["arcs"]
+    ]
+
+    def ring(arc_ids):
+        coordinates = []
+        for i in arc_ids:
+            arc = arcs[i] if i >= 0 else arcs[~i][::-1]
+            coordinates.extend(arc if not coordinates else arc[1:])
+        return coordinates
+
+    features = []
+    for geometry in topology["objects"][object_name]["geometries"]:
+        if geometry["type"] == "Polygon":
+            coordinates = [ring(r) for r in geometry["arcs"]]
+        else:
+            coordinates = [[ring(r) for r in polygon] for polygon in geometry["arcs"]]
+
+        features.append(
+            {
+                "type": "Feature",
+                "properties": geometry.get("properties", {}),
+                "geometry": {"type": geometry["type"], "coordinates": coordinates},
+            }
+        )
+
+    return {"type": "FeatureCollection", "features": features}
+
+
+@lru_cache(maxsize=2 * len(GEOMETRY_LEVELS))
+def get_geometry_response_body(level, geometry_format):
+    if geometry_format == "topojson":
+        with open(topology_path(level), "rb") as f:
+            body = f.read()
+    else:
+        geojson = topology_to_geojson(load_topology(level))
+        body = json.dumps(geojson, separators=(",", ":")).encode("utf-8")
+
+    return body, hashlib.sha1(body).hexdigest()
+
+
+def build_district_map(prices):
+    import plotly.graph_objects as go
+
+    figure = go.Figure(
+        go.Choroplethmap(
+            # The browser fetches (and caches) the geometry by URL, the
+            # figure itself only carries the prices.
+            geojson=geometry_url("coarse"),
+            featureidkey="properties.name",
+            locations=list(prices),
+            z=list(prices.values()),
+            colorscale=[[0, "#FCFAEE"], [1, "#B8001F"]],
+            marker_opacity=0.75,
+            marker_line_width=1,
+            marker_line_color="#384B70",
+            colorbar_title="€/m²",
+            hovertemplate="%{location}<br>%{z:.2f} €/m²<extra></extra>",
+        )
+    )
+    figure.update_layout(
+        map_style="carto-positron",
+        map_zoom=9.3,
+        map_center=BERLIN_CENTER,
+        margin={"l": 0, "r": 0, "t": 0, "b": 0},
+        uirevision="district-map",
+    )
+
+    return figure
+
+
+def get_district_map(prices):
+    if not geometries_available():
+        return dmc.Text(
+            "District geometries are missing, run "
+            "python data/geometries/build_district_geometries.py first."
+        )
+
+    return html.Div(
+        [
+            dcc.Graph(
+                id="district-map",
+                figure=build_district_map(prices),
+                style={"height": 600, "width": 1100},
+                config={"displayModeBar": False},
+            ),
+            dcc.Store(id="district-map-level", data="coarse"),
+        ]
+    )
+
+
+def register_geometry_routes(app):
+
+    @app.server.route("/api/geometries/districts/<level>.<geometry_format>")
+    def district_geometries(level, geometry_format):
+        if level not in GEOMETRY_LEVELS or geometry_format not in ("geojson", "topojson"):
+            abort(404)
+        if not os.path.exists(topology_path(level)):
+            abort(404)
+
+        body, etag = get_geometry_response_body(level, geometry_format)
+
+        response = Response(body, mimetype="application/json")
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = 86400
+        return response.make_conditional(request)
+
+
+def register_callbacks_district_map(app):
+
+    @app.callback(
+        Output("district-map", "figure"),
+        Output("district-map-level", "data"),
+        Input("district-map", "relayoutData"),
+        State("district-map-level", "data"),
+        prevent_initial_call=True,
+    )
+    def update_level_of_detail(relayout_data, current_level):
+        if not relayout_data or "map.zoom" not in relayout_data:
+            raise PreventUpdate
+
+        level = level_for_zoom(relayout_data["map.zoom"])
+        if level == current_level:
+            raise PreventUpdate
+
+        # Only swap the geometry URL, the rest of the figure stays as it is.
+        figure = Patch()
+        figure["data"][0]["geojson"] = geometry_url(level)
+        return figure, level
@@ -0,0 +1,130 @@
+"""Mietspiegel editions over time.
+
+Every edition converted to data/csv_files/<year>converted.csv is picked up.
+The year and size breakpoints change between editions, so the cells are
+aligned once: each cell of the current edition, for each east/west part it
+applies to, is mapped to the cell of every other edition that contains the
+middle of its year and size range. The mean values along that alignment
+give the trend of a cell without joining tables per request.
+"""
+
+import os
+import re
+from functools import lru_cache
+
+from components.mietspiegel import (
+    CURRENT_EDITION,
+    MIETSPIEGEL_CSV_DIR,
+    STADTTEILE,
+    detect_quality_rows,
+    first_matching_cell,
+    get_mietspiegel_cells,
+    parse_cells,
+)
+
+EDITION_FILE = re.compile(r"(\d{4})converted\.csv")
+
+# Marks a cell without a counterpart in the alignment table
+NO_CELL = -1
+
+
+def edition_csv_path(edition):
+    return f"{MIETSPIEGEL_CSV_DIR}/{edition}converted.csv"
+
+
+@lru_cache(maxsize=1)
+def get_editions():
+    """Years of all available editions, oldest first."""
+    editions = {CURRENT_EDITION}
+    for name in os.listdir(MIETSPIEGEL_CSV_DIR):
+        match = EDITION_FILE.fullmatch(name)
+        if match:
+            editions.add(int(match.group(1)))
+
+    return sorted(editions)
+
+
+@lru_cache(maxsize=None)
+def get_edition_cells(edition):
+    if edition == CURRENT_EDITION:
+        return get_mietspiegel_cells()
+
+    import pandas as pd
+
+    table = pd.read_csv(edition_csv_path(edition))
+    return parse_cells(table, detect_quality_rows(table))
+
+
+def cell_midpoint(cell, cells):
+    """(construction year, living area) in the middle of a cell's range."""
+    same_quality = [other for other in cells if other.quality == cell.quality]
+
+    years = [other.year_max for other in same_quality if other.year_max < cell.year_max]
+    year = (max(years) + 1 + cell.year_max) / 2 if years else cell.year_max
+
+    sizes = [
+        other.size_max
+        for other in same_quality
+        if other.year_max == cell.year_max and other.size_max < cell.size_max
+    ]
+    size = ((max(sizes) if sizes else 0) + cell.size_max) / 2
+
+    return year, size
+
+
+@lru_cache(maxsize=1)
+def get_alignment_table():
+    """Row label per (edition, current cell, stadtteil), NO_CELL if none.
+
+    Shape (editions, cells of the current edition, stadtteile), editions in
+    the order of get_editions.
+    """
+    import numpy as np
+
+    current = get_mietspiegel_cells()
+    editions = get_editions()
+
+    alignment = np.full(
+        (len(editions), len(current), len(STADTTEILE)), NO_CELL, dtype=np.int16
+    )
+    for e, edition in enumerate(editions):
+        cells = get_edition_cells(edition)
+
+        for cell in current:
+            year, size = cell_midpoint(cell, current)
+            same_quality = [other for other in cells if other.quality == cell.quality]
+
+            for s, stadtteil in enumerate(STADTTEILE):
+                if cell.stadtteil not in (None, stadtteil):
+                    continue
+                match = first_matching_cell(same_quality, stadtteil, year, size)
+                if match is not None:
+                    alignment[e, cell.row, s] = match.row
+
+    return alignment
+
+
+@lru_cache(maxsize=1)
+def get_cell_trends():
+    """Mean value in €/m² per (current cell, stadtteil, edition), NaN if none."""
+    import numpy as np
+
+    alignment = get_alignment_table()
+    trends = np.full(alignment.shape, np.nan)
+
+    for e, edition in enumerate(get_editions()):
+        means = np.array([cell.mean for cell in get_edition_cells(edition)])
+        found = alignment[e] != NO_CELL
+        trends[e][found] = means[alignment[e][found]]
+
+    return np.moveaxis(trends, 0, -1)
+
+
+def get_cell_trend(row, stadtteil):
+    """[(edition, mean value)] of a current cell for one part of the city."""
+    trend = get_cell_trends()[row, STADTTEILE.index(stadtteil)]
+    return [
+        (edition, float(mean))
+        for edition, mean in zip(get_editions(), trend)
+        if mean == mean
+    ]
@@ -0,0 +1,146 @@
+import bisect
+from functools import lru_cache
+from typing import NamedTuple
+
+MIETSPIEGEL_CSV_DIR = "data/csv_files"
+# Edition used by the calculator and the district view
+CURRENT_EDITION = 2024
+MIETSPIEGEL_CSV_PATH = f"{MIETSPIEGEL_CSV_DIR}/{CURRENT_EDITION}converted.csv"
+
+QUALITIES = ["einfach", "mittel", "gut"]
+STADTTEILE = ["west", "ost"]
+QUALITY_LABELS = {"einfach": "simple", "mittel": "medium", "gut": "good"}
+
+# Row labels (inclusive) of each residential location quality in the table
+QUALITY_ROWS = {
+    "einfach": (0, 48),
+    "mittel": (49, 116),
+    "gut": (117, 162),
+}
+
+
+class MietspiegelCell(NamedTuple):
+    row: int
+    quality: str
+    # "west" or "ost" for cells that only apply to one part of the city
+    stadtteil: str | None
+    year_max: int
+    size_max: float
+    lower: float
+    mean: float
+    upper: float
+
+
+@lru_cache(maxsize=1)
+def load_mietspiegel_table():
+    # Read once per process. When served with preload_app the master process
+    # loads it before forking, so all workers share the same pages.
+    import pandas as pd
+
+    return pd.read_csv(MIETSPIEGEL_CSV_PATH)
+
+
+def get_quality_table(quality):
+    start, end = QUALITY_ROWS[quality]
+    return load_mietspiegel_table().loc[start:end]
+
+
+@lru_cache(maxsize=1)
+def get_year_breakpoints():
+    years = load_mietspiegel_table()["Construction year (max)"].astype(str).str[:4]
+    return sorted(set(years.astype(int)))
+
+
+def get_year_bucket(construction_year):
+    """Smallest construction year breakpoint of the table >= construction_year.
+
+    All years of one bucket select the same rows of the table.
+    """
+    breakpoints = get_year_breakpoints()
+    i = bisect.bisect_left(breakpoints, construction_year)
+    return breakpoints[i] if i < len(breakpoints) else construction_year
+
+
+def parse_table_number(value):
+    return float(str(value).replace("\xa0", "").replace(" ", "").replace(",", "."))
+
+
+@lru_cache(maxsize=1)
+def get_mietspiegel_cells():
+    """All cells of the table as MietspiegelCell, indexed by row label."""
+    return parse_cells(load_mietspiegel_table(), QUALITY_ROWS)
+
+
+def detect_quality_rows(table):
+    """QUALITY_ROWS of a table: every quality block starts at the oldest year."""
+    years = table["Construction year (max)"].astype(str).str[:4].astype(int).tolist()
+    labels = table.index.tolist()
+
+    starts = [0] + [i for i in range(1, len(years)) if years[i] < years[i - 1]]
+    if len(starts) != len(QUALITIES):
+        raise ValueError(
+            f"Expected {len(QUALITIES)} quality blocks, found {len(starts)}"
+        )
+
+    ends = [start - 1 for start in starts[1:]] + [len(labels) - 1]
+    return {
+        quality: (labels[start], labels[end])
+        for quality, start, end in zip(QUALITIES, starts, ends)
+    }
+
+
+def parse_cells(table, quality_rows):
+    cells = []
+    for quality, (start, end) in quality_rows.items():
+        for row, year, size, lower, mean, upper in zip(
+            range(start, end + 1),
+            table.loc[start:end, "Construction year (max)"],
+            table.loc[start:end, "Living area (max)"],
+            table.loc[start:end, "Lower range"],
+            table.loc[start:end, "Mean value"],
+            table.loc[start:end, "Upper range"],
+        ):
+            raw_year_cell = str(year).lower()
+
+            stadtteil = None
+            if "west" in raw_year_cell:
+                stadtteil = "west"
+            elif "ost" in raw_year_cell:
+                stadtteil = "ost"
+
+            cells.append(
+                MietspiegelCell(
+                    row=row,
+                    quality=quality,
+                    stadtteil=stadtteil,
+                    year_max=int(raw_year_cell[:4]),
+                    size_max=parse_table_number(size),
+                    lower=parse_table_number(lower),
+                    mean=parse_table_number(mean),
+                    upper=parse_table_number(upper),
+                )
+            )
+
+    return tuple(cells)
+
+
+def find_cell(quality, stadtteil, construction_year, apartment_size):
+    """First cell of the table that applies to the apartment, or None."""
+    start, end = QUALITY_ROWS[quality]
+
+    return first_matching_cell(
+        get_mietspiegel_cells()[start : end + 1],
+        stadtteil,
+        construction_year,
+        apartment_size,
+    )
+
+
+def first_matching_cell(cells, stadtteil, construction_year, apartment_size):
+    for cell in cells:
+        if cell.stadtteil is not None and cell.stadtteil != stadtteil:
+            continue
+        if construction_year <= cell.year_max and apartment_size <= cell.size_max:
+            return cell
+
+    return None
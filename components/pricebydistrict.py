@@ -3,128 +3,185 @@ import dash_mantine_components as dmc
 from dash_iconify import DashIconify
 from datetime import datetime, timedelta
 from dash.exceptions import PreventUpdate
-import pandas as pd
-import requests
 from collections import Counter, defaultdict
 from functools import lru_cache
-
-pricebydistrict_layout = dmc.Group(
-    [
-        html.Div(
-            [
-                dmc.Title("Filter Options", order=5, mb=12),
-                dmc.Text("Apartment Size (m²) Range"),
-                dmc.RangeSlider(
-                    id="apartment-size-range-input",
-                    value=[50, 80],
-                    max=120,
-                    color="#384B70",
-                    size="lg",
-                    marks=[
-                        {"value": 20, "label": "20"},
-                        {"value": 50, "label": "50"},
-                        {"value": 80, "label": "80"},
-                        {"value": 120, "label": "120+"},
-                    ],
-                    mt=30,
-                    mb=40,
-                ),
-                dmc.Text("Construction Year Range", mb=12),
-                dmc.YearPickerInput(
-                    id="construction-year-range-input",
-                    type="range",
-                    leftSection=DashIconify(icon="fa:calendar"),
-                    placeholder="Pick dates range",
-                    minDate=datetime(1800, 1, 1),
-                    maxDate=datetime(2022, 1, 1),
-                    w=200,
-                    mb=30,
-                ),
-            ],
-            style={
-                "height": 700,
-                "width": 400,
-                "background": "#FCFAEE",
-                "padding": 20,
-                "border-radius": 20,
-                "border": "2px solid #384B70",
-            },
-        ),
-       html.Div(
-            id="median-rent",
-            children=[
-                html.Div(
-                    style={"position": "relative"},
-                    children=[
-                        dmc.LoadingOverlay(
-                            id="loading-overlay",
-                            visible=False,
-                            zIndex=1000,
-                        ),
-                        dmc.Button(
-                            "Show Median Rent by District",
-                            id="show-median-rent-button",
-                            variant="default",
-                            color="#384B70",
-                            size="md",
-                            radius="md",
-                            leftSection=DashIconify(
-                                icon="twemoji:magnifying-glass-tilted-left"
-                            ),
-                        ),
-                        html.Div(id="body-div"),
-                    ],
-                ),
-            ],
-            style={
-                "height": 700,
-                "width": 1300,
-                "background": "#FCFAEE",
-                "border-radius": 20,
-                "border": "2px solid #384B70",
-                "display": "flex",
-                "justifyContent": "center",
-                "alignItems": "center",
-            },
-        ),
-    ]
+import logging
+from components.mietspiegel import (
+    QUALITIES,
+    STADTTEILE,
+    get_mietspiegel_cells,
+    get_quality_table,
 )
-
-BERLIN_DISTRICTS = [
-    "Charlottenburg-Wilmersdorf",
-    "Friedrichshain-Kreuzberg",
-    "Lichtenberg",
-    "Marzahn-Hellersdorf",
-    "Mitte",
-    "Neukölln",
-    "Pankow",
-    "Reinickendorf",
-    "Spandau",
-    "Steglitz-Zehlendorf",
-    "Tempelhof-Schöneberg",
-    "Treptow-Köpenick",
+from components.rent_distribution import address_weights, rent_distribution
+from components.editions import get_cell_trends, get_editions
+from components.address_store import get_snapshot_counts, snapshot_checked_at
+from components.cache import format_age, stale_while_revalidate
+from components.wfs import BERLIN_DISTRICTS, CACHE_MAX_AGE, WFSError, get_features
+from components.district_map import get_district_map
+from components.profiling import profiled
+
+logger = logging.getLogger(__name__)
+
+TREND_COLORS = [
+    "#384B70",
+    "#507687",
+    "#B8001F",
+    "#b86b00",
+    "#1fb800",
+    "#8fa3c7",
+    "#6b3fa0",
+    "#c2185b",
+    "#00897b",
+    "#5d4037",
+    "#f9a825",
+    "#455a64",
 ]
 
 
-@lru_cache(maxsize=15)
+# Built on first use of the tab, see get_calculator_layout.
+@lru_cache(maxsize=1)
+def get_pricebydistrict_layout():
+    return dmc.Group(
+        [
+            html.Div(
+                [
+                    dmc.Title("Filter Options", order=5, mb=12),
+                    dmc.Text("Apartment Size (m²) Range"),
+                    dmc.RangeSlider(
+                        id="apartment-size-range-input",
+                        value=[50, 80],
+                        max=120,
+                        color="#384B70",
+                        size="lg",
+                        marks=[
+                            {"value": 20, "label": "20"},
+                            {"value": 50, "label": "50"},
+                            {"value": 80, "label": "80"},
+                            {"value": 120, "label": "120+"},
+                        ],
+                        mt=30,
+                        mb=40,
+                    ),
+                    dmc.Text("Construction Year Range", mb=12),
+                    dmc.YearPickerInput(
+                        id="construction-year-range-input",
+                        type="range",
+                        leftSection=DashIconify(icon="fa:calendar"),
+                        placeholder="Pick dates range",
+                        minDate=datetime(1800, 1, 1),
+                        maxDate=datetime(2022, 1, 1),
+                        w=200,
+                        mb=30,
+                    ),
+                    dmc.Text("View", mb=12),
+                    dmc.SegmentedControl(
+                        id="district-view-input",
+                        value="charts",
+                        data=[
+                            {"value": "charts", "label": "Charts"},
+                            {"value": "map", "label": "Map"},
+                            {"value": "trend", "label": "Trend"},
+                        ],
+                        color="#384B70",
+                        mb=30,
+                    ),
+                ],
+                style={
+                    "height": 700,
+                    "width": 400,
+                    "background": "#FCFAEE",
+                    "padding": 20,
+                    "border-radius": 20,
+                    "border": "2px solid #384B70",
+                },
+            ),
+           html.Div(
+                id="median-rent",
+                children=[
+                    html.Div(
+                        style={"position": "relative"},
+                        children=[
+                            dmc.LoadingOverlay(
+                                id="loading-overlay",
+                                visible=False,
+                                zIndex=1000,
+                            ),
+                            dmc.Button(
+                                "Show Median Rent by District",
+                                id="show-median-rent-button",
+                                variant="default",
+                                color="#384B70",
+                                size="md",
+                                radius="md",
+                                leftSection=DashIconify(
+                                    icon="twemoji:magnifying-glass-tilted-left"
+                                ),
+                            ),
+                            html.Div(id="body-div"),
+                        ],
+                    ),
+                ],
+                style={
+                    "height": 700,
+                    "width": 1300,
+                    "background": "#FCFAEE",
+                    "border-radius": 20,
+                    "border": "2px solid #384B70",
+                    "display": "flex",
+                    "justifyContent": "center",
+                    "alignItems": "center",
+                },
+            ),
+        ]
+    )
+
+
 def get_location_data_by_district(district):
-    url = "https://gdi.berlin.de/services/wfs/wohnlagenadr2024"
+    # The local snapshot has the counts precomputed, the WFS is the fallback.
+    counts = get_snapshot_counts(district)
+    if counts is not None:
+        return counts
 
-    cql = f"bezname='{district}'"
+    try:
+        return fetch_location_data_by_district(district)
+    except WFSError:
+        # Never fetched and the WFS is down, the district is left out.
+        logger.warning("No location data for %s", district, exc_info=True)
+        return None
 
-    params = {
-        "SERVICE": "WFS",
-        "REQUEST": "GetFeature",
-        "VERSION": "1.1.0",
-        "TYPENAME": "wohnlagenadr2024:wohnlagenadr2024",
-        "OUTPUTFORMAT": "json",
-        "cql_filter": cql,
-    }
 
-    response = requests.get(url, params=params)
-    data = response.json()
+def get_location_data_by_districts():
+    """{district: location data} of all districts, fetched in parallel.
 
-    features = data.get("features", [])
+    A callback takes at most one WFS timeout, not one per district.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=len(BERLIN_DISTRICTS)) as pool:
+        return dict(
+            zip(
+                BERLIN_DISTRICTS,
+                pool.map(get_location_data_by_district, BERLIN_DISTRICTS),
+            )
+        )
+
+
+def get_district_data_time():
+    """When the oldest district data shown was fetched, or None."""
+    times = []
+    for district in BERLIN_DISTRICTS:
+        if get_snapshot_counts(district) is not None:
+            times.append(snapshot_checked_at())
+        else:
+            times.append(fetch_location_data_by_district.fetched_at(district))
+
+    times = [t for t in times if t is not None]
+    return min(times) if times else None
+
+
+@stale_while_revalidate(CACHE_MAX_AGE, maxsize=15)
+def fetch_location_data_by_district(district):
+    features = get_features(f"bezname='{district}'", ["wol", "stadtteil"])
     if not features:
         return None
 
@@ -204,78 +261,229 @@ def filter_with_grouped_upper_bound(df, year_range, area_range):
     return df.loc[[r.name for r in selected_rows]]
 
 
-def get_average_mean_by_quality(year_range, size_range):
-    csv_path = "data/csv_files/2024converted.csv"
-    current_mietspiegel_table = pd.read_csv(csv_path)
+def get_district_counts(location_data=None):
+    import numpy as np
+
+    if location_data is None:
+        location_data = get_location_data_by_districts()
+
+    # districts x qualities x stadtteile
+    counts = np.zeros(
+        (len(BERLIN_DISTRICTS), len(QUALITIES), len(STADTTEILE)), dtype=np.int32
+    )
+
+    for d, district in enumerate(BERLIN_DISTRICTS):
+        count_by_distr = location_data[district] or {}
+
+        for q, quality in enumerate(QUALITIES):
+            for e, stadtteil in enumerate(STADTTEILE):
+                counts[d, q, e] = count_by_distr.get(quality, {}).get(stadtteil, 0)
+
+    return counts
+
+
+def get_selected_rows(year_range, size_range):
+    rows = []
+    for quality in QUALITIES:
+        subset = filter_with_grouped_upper_bound(
+            get_quality_table(quality), year_range, size_range
+        )
+        # "index" holds the original row label of the selected cells
+        rows.extend(subset["index"])
+
+    return rows
+
+
+def get_selected_cells(year_range, size_range):
+    import numpy as np
+
+    cells = get_mietspiegel_cells()
+
+    values = []
+    applicability = []
+
+    for cell in (cells[row] for row in get_selected_rows(year_range, size_range)):
+        applies = np.zeros((len(QUALITIES), len(STADTTEILE)), dtype=bool)
+        applies[QUALITIES.index(cell.quality)] = [
+            cell.stadtteil in (None, stadtteil) for stadtteil in STADTTEILE
+        ]
+
+        values.append(cell.mean)
+        applicability.append(applies)
+
+    return np.array(values), np.array(applicability)
+
+
+def get_rent_distribution_by_district(year_range, size_range, counts=None):
+    if counts is None:
+        counts = get_district_counts()
+
+    values, applicability = get_selected_cells(year_range, size_range)
+    distribution = rent_distribution(counts, values, applicability)
+
+    rent_by_district = {}
+    for d, district in enumerate(BERLIN_DISTRICTS):
+        if distribution["addresses"][d] == 0:
+            continue
+
+        p10, p25, median, p75, p90 = distribution["percentiles"][d]
+        rent_by_district[district] = {
+            "p10": round(float(p10), 2),
+            "p25": round(float(p25), 2),
+            "median": round(float(median), 2),
+            "p75": round(float(p75), 2),
+            "p90": round(float(p90), 2),
+            "mean": round(float(distribution["mean"][d]), 2),
+        }
+
+    return rent_by_district
 
-    table_cropped_simple = current_mietspiegel_table.loc[0:48]
-    table_cropped_medium = current_mietspiegel_table.loc[49:116]
-    table_cropped_good = current_mietspiegel_table.loc[117:162]
 
-    subset_simple = filter_with_grouped_upper_bound(
-        table_cropped_simple, year_range, size_range
+def get_trend_by_district(year_range, size_range, counts=None):
+    """{district: {"means", "deltas"}} per edition of get_editions, None if unknown."""
+    if counts is None:
+        counts = get_district_counts()
+    return compute_trend_by_district(
+        tuple(year_range), tuple(size_range), counts.tobytes()
     )
-    subset_medium = filter_with_grouped_upper_bound(
-        table_cropped_medium, year_range, size_range
+
+
+@lru_cache(maxsize=256)
+def compute_trend_by_district(year_range, size_range, counts_bytes):
+    # Keyed on the raw counts, so new address data gives a new entry.
+    import numpy as np
+
+    counts = np.frombuffer(counts_bytes, dtype=np.int32).reshape(
+        len(BERLIN_DISTRICTS), len(QUALITIES), len(STADTTEILE)
     )
-    subset_good = filter_with_grouped_upper_bound(
-        table_cropped_good, year_range, size_range
+    cells = get_mietspiegel_cells()
+    trends = get_cell_trends()
+
+    # One entry per selected cell and east/west part, since the aligned
+    # cells of other editions can differ between the two.
+    values = []
+    applicability = []
+    for row in get_selected_rows(year_range, size_range):
+        cell = cells[row]
+        for s, stadtteil in enumerate(STADTTEILE):
+            if cell.stadtteil not in (None, stadtteil):
+                continue
+            applies = np.zeros((len(QUALITIES), len(STADTTEILE)), dtype=bool)
+            applies[QUALITIES.index(cell.quality), s] = True
+
+            values.append(trends[row, s])
+            applicability.append(applies)
+
+    values = np.array(values).reshape(-1, len(get_editions()))
+    weights = address_weights(counts, np.array(applicability))
+
+    # Cells without a counterpart in an edition are left out of its mean.
+    known = ~np.isnan(values)
+    totals = weights @ known
+    means = np.divide(
+        weights @ np.where(known, values, 0),
+        totals,
+        out=np.full(totals.shape, np.nan),
+        where=totals > 0,
     )
+    deltas = np.diff(means, axis=1, prepend=np.nan)
 
-    simple_average_mean = get_average_mean_from_subset(subset_simple)
-    medium_average_mean = get_average_mean_from_subset(subset_medium)
-    good_average_mean = get_average_mean_from_subset(subset_good)
+    def rounded(values):
+        return [None if np.isnan(value) else round(float(value), 2) for value in values]
 
     return {
-        "einfach": simple_average_mean,
-        "mittel": medium_average_mean,
-        "gut": good_average_mean,
+        district: {"means": rounded(means[d]), "deltas": rounded(deltas[d])}
+        for d, district in enumerate(BERLIN_DISTRICTS)
+        if counts[d].sum() > 0
     }
 
 
-def get_average_mean_by_district(year_range, size_range):
-
-    average_mean_by_quality = get_average_mean_by_quality(
-        year_range, size_range
-    )  # {'einfach': n1, 'mittel': n2, 'gut': n3}
-    average_mean_values_by_district = {}
+def get_trend_view(year_range, size_range, counts=None):
+    editions = get_editions()
+    if len(editions) < 2:
+        return html.Div(
+            [
+                html.H3("Mean Rent by District over Time (€/m²)"),
+                dmc.Text(
+                    f"Only the {editions[0]} edition of the Mietspiegel is available, "
+                    "so there is no trend to show yet."
+                ),
+            ]
+        )
 
-    for district in BERLIN_DISTRICTS:
-        count_by_distr = get_location_data_by_district(
-            district
-        )  # {'einfach': { 'west': c1, 'ost': c2 }, 'mittel': ....}
-
-        count_simple = count_by_distr.get("einfach", {}).get(
-            "west", 0
-        ) + count_by_distr.get("einfach", {}).get("ost", 0)
-        count_medium = count_by_distr.get("mittel", {}).get(
-            "west", 0
-        ) + count_by_distr.get("mittel", {}).get("ost", 0)
-        count_good = count_by_distr.get("gut", {}).get("west", 0) + count_by_distr.get(
-            "gut", {}
-        ).get("ost", 0)
-        count_all = count_simple + count_medium + count_good
-
-        average_mean_value_for_district = round(
-            (
-                count_simple * average_mean_by_quality["einfach"]
-                + count_medium * average_mean_by_quality["mittel"]
-                + count_good * average_mean_by_quality["gut"]
-            )
-            / count_all,
-            2,
+    trend_by_district = get_trend_by_district(year_range, size_range, counts)
+    if not trend_by_district:
+        return html.H3(
+            "The district data is not available right now, please try again later"
         )
 
-        average_mean_values_by_district[district] = average_mean_value_for_district
+    data_trend = [
+        {
+            "edition": str(edition),
+            **{
+                district: trend["means"][e]
+                for district, trend in trend_by_district.items()
+                if trend["means"][e] is not None
+            },
+        }
+        for e, edition in enumerate(editions)
+    ]
+    data_change = [
+        {
+            "district": district,
+            "change": round(trend["means"][-1] - trend["means"][0], 2),
+        }
+        for district, trend in trend_by_district.items()
+        if trend["means"][0] is not None and trend["means"][-1] is not None
+    ]
+
+    return html.Div(
+        [
+            dmc.Group(
+                [
+                    html.H3("Mean Rent by District over Time (€/m²)"),
+                    html.H3(f"Change since {editions[0]} (€/m²)"),
+                ],
+                justify="space-between",
+            ),
+            dmc.Group(
+                [
+                    dmc.LineChart(
+                        h=600,
+                        w=600,
+                        data=data_trend,
+                        dataKey="edition",
+                        series=[
+                            {"name": district, "color": color}
+                            for district, color in zip(
+                                trend_by_district, TREND_COLORS
+                            )
+                        ],
+                        withLegend=True,
+                    ),
+                    dmc.BarChart(
+                        h=600,
+                        w=500,
+                        orientation="vertical",
+                        data=data_change,
+                        dataKey="district",
+                        series=[{"name": "change", "color": "#384B70"}],
+                        style={"paddingLeft": "100px"},
+                    ),
+                ],
+            ),
+        ]
+    )
 
-    return average_mean_values_by_district
 
+def build_district_quality_array(location_data=None):
+    if location_data is None:
+        location_data = get_location_data_by_districts()
 
-def build_district_quality_array():
     result_array = []
 
     for district in BERLIN_DISTRICTS:
-        data = get_location_data_by_district(district)
+        data = location_data[district]
 
         if not data:
             continue
@@ -292,20 +500,6 @@ def build_district_quality_array():
     return result_array
 
 
-def get_average_mean_from_subset(df):
-
-    sum = 0
-    for _, row in df.iterrows():
-
-        mean_value = float(str(row["Mean value"]).replace(",", "."))
-
-        sum += mean_value
-
-    result = round(sum / df.shape[0], 2)
-
-    return result
-
-
 def parse_year_range(date_range):
     try:
         start_year = int(str(date_range[0])[:4])
@@ -348,10 +542,14 @@ def register_callbacks_mapview(app):
         [
             Input("apartment-size-range-input", "value"),
             Input("construction-year-range-input", "value"),
+            Input("district-view-input", "value"),
         ],
         prevent_initial_call=True,
     )
-    def update_output(n_clicks, apartment_size_range, construction_year_range):
+    @profiled
+    def update_output(
+        n_clicks, apartment_size_range, construction_year_range, view
+    ):
         if n_clicks is None:
             raise PreventUpdate
         elif any(x is None for x in apartment_size_range) is None or any(x is None for x in construction_year_range):
@@ -361,20 +559,58 @@ def register_callbacks_mapview(app):
             parsed_year_range = parse_year_range(construction_year_range)
             parsed_size_range = parse_size_range(apartment_size_range)
 
+            # Fetched once per click and shared by all charts
+            location_data = get_location_data_by_districts()
+            counts = get_district_counts(location_data)
+
+            if view == "trend":
+                return False, hidden_style, get_trend_view(
+                    parsed_year_range, parsed_size_range, counts
+                )
+
+            rent_by_district = get_rent_distribution_by_district(
+                parsed_year_range, parsed_size_range, counts
+            )
+            if not rent_by_district:
+                return False, hidden_style, html.H3(
+                    "The district data is not available right now, please try again later"
+                )
+
+            fetched_at = get_district_data_time()
+            data_age_note = dmc.Text(
+                f"District data updated {format_age(fetched_at)}",
+                size="xs",
+                c="dimmed",
+            ) if fetched_at is not None else None
+
+            if view == "map":
+                return False, hidden_style, html.Div(
+                    [
+                        html.H3("Median Rent by District (€/m²)"),
+                        get_district_map(
+                            {k: v["median"] for k, v in rent_by_district.items()}
+                        ),
+                        data_age_note,
+                    ]
+                )
+
             data_price = [
-                {"district": k, "average price": v}
-                for k, v in get_average_mean_by_district(
-                    parsed_year_range, parsed_size_range
-                ).items()
+                {
+                    "district": k,
+                    "25th percentile": v["p25"],
+                    "median": v["median"],
+                    "75th percentile": v["p75"],
+                }
+                for k, v in rent_by_district.items()
             ]
 
-            data_location_quality_count = build_district_quality_array()
+            data_location_quality_count = build_district_quality_array(location_data)
 
         return False, hidden_style, html.Div(
             [
                 dmc.Group(
                     [
-                        html.H3(f"Average Rent Price by District (€/m²)"),
+                        html.H3(f"Median Rent by District (€/m²)"),
                         html.H3(f"Location Quality by District"),
                     ],
                     justify="space-between",
@@ -387,7 +623,11 @@ def register_callbacks_mapview(app):
                             orientation="vertical",
                             data=data_price,
                             dataKey="district",
-                            series=[{"name": "average price", "color": "#384B70"}],
+                            series=[
+                                {"name": "25th percentile", "color": "#8fa3c7"},
+                                {"name": "median", "color": "#384B70"},
+                                {"name": "75th percentile", "color": "#507687"},
+                            ],
                         ),
                         dmc.BarChart(
                             h=600,
@@ -405,7 +645,7 @@ def register_callbacks_mapview(app):
                         ),
                     ],
                 ),
-                
+                data_age_note,
             ]
         )
 
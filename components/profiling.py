@@ -0,0 +1,180 @@
+"""Profile a fraction of the Dash callback invocations in production.
+
+The sampling rate starts from MIETSPIEGEL_PROFILE_RATE (0 to 1, default 0)
+and can be changed at runtime through POST /admin/profiling, which writes it
+to a RATE file that every worker checks every few seconds. A sampled
+invocation is traced with sys.setprofile and written to PROFILE_DIR as
+collapsed stacks ("frame;frame;frame microseconds"), the input format of
+flamegraph.pl, speedscope and similar tools. The root frame names the
+callback and the size of its inputs.
+
+While the rate is 0 a callback only pays for one time check.
+"""
+
+import functools
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import abort, jsonify, request
+
+PROFILE_DIR = os.environ.get("MIETSPIEGEL_PROFILE_DIR", "profiles")
+RATE_FILE = os.path.join(PROFILE_DIR, "RATE")
+
+# How often a worker looks for a changed rate, in seconds
+CHECK_INTERVAL = 5
+
+logger = logging.getLogger(__name__)
+
+
+def read_rate():
+    try:
+        with open(RATE_FILE, encoding="utf-8") as f:
+            return float(f.read().strip() or 0)
+    except FileNotFoundError:
+        return float(os.environ.get("MIETSPIEGEL_PROFILE_RATE", 0))
+    except ValueError:
+        return 0.0
+
+
+def write_rate(rate):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    tmp_file = RATE_FILE + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        f.write(str(rate))
+    os.replace(tmp_file, RATE_FILE)
+
+
+_checked_at = 0.0
+_rate = read_rate()
+_rate_lock = threading.Lock()
+
+
+def current_rate():
+    global _checked_at, _rate
+
+    now = time.monotonic()
+    if now - _checked_at >= CHECK_INTERVAL:
+        with _rate_lock:
+            if now - _checked_at >= CHECK_INTERVAL:
+                _rate = read_rate()
+                _checked_at = now
+
+    return _rate
+
+
+def frame_name(code):
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class CollapsedStackProfiler:
+    """Time spent in every call stack of the current thread, in nanoseconds."""
+
+    def __init__(self, root):
+        self.stack = [root]
+        self.totals = Counter()
+        self._last = 0
+
+    def _hook(self, frame, event, arg):
+        now = time.perf_counter_ns()
+        self.totals[tuple(self.stack)] += now - self._last
+
+        if event == "call":
+            self.stack.append(frame_name(frame.f_code))
+        elif event == "c_call":
+            self.stack.append(f"{getattr(arg, '__qualname__', arg)} (builtin)")
+        elif len(self.stack) > 1:
+            # return, c_return and c_exception
+            self.stack.pop()
+
+        self._last = time.perf_counter_ns()
+
+    def __enter__(self):
+        self._last = time.perf_counter_ns()
+        sys.setprofile(self._hook)
+        return self
+
+    def __exit__(self, *exc_info):
+        sys.setprofile(None)
+
+    def collapsed(self):
+        return [
+            f"{';'.join(stack)} {nanoseconds // 1000}"
+            for stack, nanoseconds in self.totals.items()
+            if nanoseconds >= 1000
+        ]
+
+
+def input_size(value):
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+def profiled(function):
+    """Profile a fraction of the calls of a callback, see current_rate."""
+    name = f"{function.__module__}.{function.__name__}"
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        rate = current_rate()
+        if rate <= 0 or random.random() >= rate:
+            return function(*args, **kwargs)
+
+        sizes = "/".join(str(input_size(arg)) for arg in args)
+        profiler = CollapsedStackProfiler(f"{name} (input bytes {sizes})")
+        started = time.perf_counter()
+        try:
+            with profiler:
+                return function(*args, **kwargs)
+        finally:
+            write_profile(name, profiler, time.perf_counter() - started)
+
+    return wrapper
+
+
+def write_profile(name, profiler, duration):
+    timestamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    path = os.path.join(
+        PROFILE_DIR,
+        f"{timestamp}-{name}-{os.getpid()}-{round(duration * 1000)}ms.folded",
+    )
+
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(profiler.collapsed()) + "\n")
+    except OSError:
+        # Profiling must never break the callback itself.
+        logger.warning("Could not write profile %s", path, exc_info=True)
+
+
+def register_profiling_routes(app):
+
+    @app.server.route("/admin/profiling", methods=["GET", "POST"])
+    def profiling():
+        # Only available when an admin token is configured.
+        token = os.environ.get("MIETSPIEGEL_ADMIN_TOKEN")
+        if not token:
+            abort(404)
+        # Constant time, the comparison must not reveal how much of it matched.
+        given = request.headers.get("X-Admin-Token", "")
+        if not hmac.compare_digest(given.encode("utf-8"), token.encode("utf-8")):
+            abort(403)
+
+        if request.method == "POST":
+            # {"rate": 0.05} profiles 5% of the callback invocations
+            rate = (request.get_json(silent=True) or {}).get("rate")
+            if not isinstance(rate, (int, float)) or not 0 <= rate <= 1:
+                return jsonify({"error": "rate must be a number from 0 to 1"}), 400
+            write_rate(rate)
+
+        return jsonify({"rate": read_rate(), "profile_dir": PROFILE_DIR})
@@ -0,0 +1,64 @@
+"""Distribution of the expected rent over all addresses of a district.
+
+All addresses with the same location quality and the same east/west part of
+the city get the same Mietspiegel cells, so a district is fully described by
+a small count matrix (quality x east/west). Every address spreads its weight
+evenly over the cells selected for its group, which gives a weighted
+distribution of €/m² values per district without touching single addresses.
+"""
+
+from components.mietspiegel import QUALITIES, STADTTEILE
+
+PERCENTILES = [10, 25, 50, 75, 90]
+
+
+def address_weights(counts, applicability):
+    """Weight of every selected cell per district.
+
+    counts: (districts, qualities, stadtteile) number of addresses
+    applicability: (cells, qualities, stadtteile) whether a cell applies
+    """
+    import numpy as np
+
+    cells_per_group = applicability.sum(axis=0)
+    share = np.divide(
+        applicability,
+        cells_per_group,
+        out=np.zeros(applicability.shape, dtype=np.float64),
+        where=cells_per_group > 0,
+    )
+
+    groups = len(QUALITIES) * len(STADTTEILE)
+    return counts.reshape(len(counts), groups) @ share.reshape(len(share), groups).T
+
+
+def weighted_percentiles(values, weights, percentiles):
+    import numpy as np
+
+    order = np.argsort(values)
+    values = values[order]
+    cumulative = np.cumsum(weights[:, order], axis=1)
+
+    targets = np.asarray(percentiles) / 100 * cumulative[:, -1:]
+    # Index of the first value whose cumulative weight reaches the target
+    positions = (cumulative[:, None, :] < targets[:, :, None] - 1e-9).sum(axis=2)
+    return values[np.minimum(positions, len(values) - 1)]
+
+
+def rent_distribution(counts, values, applicability):
+    """Percentiles and mean of €/m² for every district (row)."""
+    import numpy as np
+
+    weights = address_weights(counts, applicability)
+    totals = weights.sum(axis=1)
+
+    percentiles = weighted_percentiles(values, weights, PERCENTILES)
+    means = np.divide(
+        weights @ values, totals, out=np.full(len(totals), np.nan), where=totals > 0
+    )
+
+    return {
+        "percentiles": percentiles,
+        "mean": means,
+        "addresses": totals,
+    }
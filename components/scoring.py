@@ -0,0 +1,217 @@
+"""Batch scoring of rental listings against the Mietspiegel.
+
+Every cell gets its thresholds in €/m² computed once: the lower and upper
+range, the mean value and the Mietpreisbremse cap (mean value + 10%). A
+lookup array maps (quality, stadtteil, year bucket, size bucket) to the cell
+find_cell would pick, so a whole batch of listings is scored with a few
+NumPy operations and no Python loop per listing.
+"""
+
+from functools import lru_cache
+
+from flask import jsonify, request
+
+from components.mietspiegel import (
+    QUALITIES,
+    STADTTEILE,
+    find_cell,
+    get_mietspiegel_cells,
+    get_year_breakpoints,
+)
+
+# Rents may exceed the local comparative rent by at most 10%
+CAP_FACTOR = 1.10
+
+NO_DATA = -1
+BELOW_RANGE = 0
+WITHIN_RANGE = 1
+# Above the cap but still within the range of the cell
+EXCEEDS_CAP = 2
+ABOVE_UPPER = 3
+
+CATEGORY_LABELS = {
+    NO_DATA: "no data",
+    BELOW_RANGE: "below range",
+    WITHIN_RANGE: "within range",
+    EXCEEDS_CAP: "exceeds cap",
+    ABOVE_UPPER: "above upper",
+}
+
+
+@lru_cache(maxsize=1)
+def get_cell_thresholds():
+    """{"lower", "mean", "upper", "cap"}: €/m² per cell, indexed by row label."""
+    import numpy as np
+
+    cells = get_mietspiegel_cells()
+    mean = np.array([cell.mean for cell in cells])
+
+    return {
+        "lower": np.array([cell.lower for cell in cells]),
+        "mean": mean,
+        "upper": np.array([cell.upper for cell in cells]),
+        "cap": np.round(mean * CAP_FACTOR, 2),
+    }
+
+
+@lru_cache(maxsize=1)
+def get_size_breakpoints():
+    return sorted({cell.size_max for cell in get_mietspiegel_cells()})
+
+
+@lru_cache(maxsize=1)
+def get_cell_lookup():
+    """Row label of the cell per (quality, stadtteil, year bucket, size bucket).
+
+    Bucket i holds the values up to the i-th breakpoint, the last bucket
+    everything above the largest one. NO_DATA where no cell applies.
+    """
+    import numpy as np
+
+    years = get_year_breakpoints()
+    sizes = get_size_breakpoints()
+
+    lookup = np.full(
+        (len(QUALITIES), len(STADTTEILE), len(years) + 1, len(sizes) + 1),
+        NO_DATA,
+        dtype=np.int16,
+    )
+    # All values of a bucket select the same cell as its breakpoint.
+    for q, quality in enumerate(QUALITIES):
+        for s, stadtteil in enumerate(STADTTEILE):
+            for y, year in enumerate(years + [float("inf")]):
+                for a, size in enumerate(sizes + [float("inf")]):
+                    cell = find_cell(quality, stadtteil, year, size)
+                    if cell is not None:
+                        lookup[q, s, y, a] = cell.row
+
+    return lookup
+
+
+def quality_codes(wol):
+    """Index into QUALITIES, NO_DATA for anything else."""
+    import numpy as np
+
+    wol = np.char.lower(np.asarray(wol, dtype=str))
+    return np.select(
+        [wol == name for name in QUALITIES],
+        range(len(QUALITIES)),
+        default=NO_DATA,
+    )
+
+
+def stadtteil_codes(stadtteil):
+    """Index into STADTTEILE, NO_DATA for anything else."""
+    import numpy as np
+
+    stadtteil = np.char.lower(np.asarray(stadtteil, dtype=str))
+    return np.select(
+        [stadtteil == name for name in STADTTEILE],
+        range(len(STADTTEILE)),
+        default=NO_DATA,
+    )
+
+
+def score_listings(wol, stadtteil, construction_year, apartment_size, offered_rent):
+    """Score a batch of listings, all arguments are array-likes of one length.
+
+    Returns a dict of arrays: the cell row label, the rent and thresholds in
+    €/m², the difference to the mean value in percent and the category.
+    Listings without an applicable cell get NO_DATA and NaN.
+    """
+    import numpy as np
+
+    years = np.asarray(construction_year, dtype=np.float64)
+    sizes = np.asarray(apartment_size, dtype=np.float64)
+    rents = np.asarray(offered_rent, dtype=np.float64)
+    qualities = quality_codes(wol)
+    stadtteile = stadtteil_codes(stadtteil)
+
+    year_buckets = np.searchsorted(get_year_breakpoints(), years, side="left")
+    size_buckets = np.searchsorted(get_size_breakpoints(), sizes, side="left")
+
+    valid = (
+        (qualities != NO_DATA)
+        & (stadtteile != NO_DATA)
+        & np.isfinite(years)
+        & (sizes > 0)
+    )
+    cells = np.full(len(years), NO_DATA, dtype=np.int16)
+    cells[valid] = get_cell_lookup()[
+        qualities[valid],
+        stadtteile[valid],
+        year_buckets[valid],
+        size_buckets[valid],
+    ]
+
+    found = cells != NO_DATA
+    thresholds = {
+        name: np.where(found, values[np.where(found, cells, 0)], np.nan)
+        for name, values in get_cell_thresholds().items()
+    }
+    rent_per_m2 = np.divide(
+        rents, sizes, out=np.full(len(rents), np.nan), where=sizes > 0
+    )
+
+    # Ordered by severity, the first matching condition wins.
+    categories = np.select(
+        [
+            ~found | np.isnan(rent_per_m2),
+            rent_per_m2 > thresholds["upper"],
+            rent_per_m2 > thresholds["cap"],
+            rent_per_m2 < thresholds["lower"],
+        ],
+        [NO_DATA, ABOVE_UPPER, EXCEEDS_CAP, BELOW_RANGE],
+        default=WITHIN_RANGE,
+    )
+
+    return {
+        "cell": cells,
+        "rent_per_m2": rent_per_m2,
+        **thresholds,
+        "difference_mean": np.round(
+            (rent_per_m2 - thresholds["mean"]) / thresholds["mean"] * 100, 2
+        ),
+        "category": categories,
+    }
+
+
+def register_scoring_routes(app):
+
+    @app.server.route("/api/score", methods=["POST"])
+    def score():
+        # {"listings": [{"wol", "stadtteil", "year", "size", "rent"}, ...]}
+        payload = request.get_json(silent=True) or {}
+        if not isinstance(payload, dict):
+            return jsonify({"error": "invalid listings"}), 400
+        listings = payload.get("listings", [])
+
+        try:
+            scores = score_listings(
+                [listing.get("wol") or "" for listing in listings],
+                [listing.get("stadtteil") or "" for listing in listings],
+                [listing.get("year", "nan") for listing in listings],
+                [listing.get("size", 0) for listing in listings],
+                [listing.get("rent", "nan") for listing in listings],
+            )
+        except (AttributeError, TypeError, ValueError):
+            return jsonify({"error": "invalid listings"}), 400
+
+        return jsonify(
+            {
+                "scores": [
+                    {
+                        "category": CATEGORY_LABELS[int(category)],
+                        "rent_per_m2": None if rent != rent else round(float(rent), 2),
+                        "cap_per_m2": None if cap != cap else float(cap),
+                        "difference_mean": None if diff != diff else float(diff),
+                    }
+                    for category, rent, cap, diff in zip(
+                        scores["category"],
+                        scores["rent_per_m2"],
+                        scores["cap"],
+                        scores["difference_mean"],
+                    )
+                ]
+            }
+        )
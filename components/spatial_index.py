@@ -0,0 +1,177 @@
+import math
+
+from flask import jsonify, request
+
+from components.address_store import SnapshotValue
+from components.address_table import UNKNOWN, get_address_table
+from components.mietspiegel import QUALITIES, STADTTEILE
+from components.wfs import BERLIN_DISTRICTS, WFSError
+
+# Roughly 170 m x 280 m per cell at Berlin's latitude.
+CELL_SIZE = 0.0025
+METERS_PER_DEGREE = 111_320
+
+# (south, west, north, east) around Berlin with a margin of a few km
+BERLIN_BOUNDS = (52.3, 13.0, 52.7, 13.8)
+# Largest search radius in metres, keeps the number of searched cells small
+MAX_DISTANCE = 1000
+
+
+def within_berlin(lat, lon):
+    south, west, north, east = BERLIN_BOUNDS
+    # False for NaN as well
+    return south <= lat <= north and west <= lon <= east
+
+
+def cell_ids(lats, lons):
+    import numpy as np
+
+    rows = np.floor(np.asarray(lats, dtype=np.float64) / CELL_SIZE).astype(np.int64)
+    cols = np.floor(np.asarray(lons, dtype=np.float64) / CELL_SIZE).astype(np.int64)
+    return rows * 1_000_000 + cols
+
+
+def compute_grid(table):
+    """(sorted cell ids, table rows in cell order) of all usable address points."""
+    import numpy as np
+
+    known = np.flatnonzero(
+        (table.wol != UNKNOWN)
+        & (table.stadtteil != UNKNOWN)
+        & ~np.isnan(table.lat)
+        & ~np.isnan(table.lon)
+    )
+    cells = cell_ids(table.lat[known], table.lon[known])
+
+    order = np.argsort(cells, kind="stable")
+    return cells[order], known[order].astype(np.uint32)
+
+
+class GridIndex:
+    """Uniform grid over the address points of the Wohnlagen layer.
+
+    The table rows are ordered by grid cell, so all points of a cell are one
+    contiguous slice of that order. A lookup only measures the distance to
+    points in the cells around the query. A table mapped from the address
+    store already carries the grid, then nothing is copied per worker.
+    """
+
+    def __init__(self, table):
+        self._table = table
+        if table.grid_order is not None:
+            self._cells, self._order = table.grid_cell, table.grid_order
+        else:
+            self._cells, self._order = compute_grid(table)
+
+    def __len__(self):
+        return len(self._order)
+
+    def _candidates(self, lat, lon, rings):
+        row = math.floor(lat / CELL_SIZE)
+        col = math.floor(lon / CELL_SIZE)
+
+        for r in range(row - rings, row + rings + 1):
+            first = r * 1_000_000 + col - rings
+            last = r * 1_000_000 + col + rings
+            start = self._cells.searchsorted(first, side="left")
+            end = self._cells.searchsorted(last, side="right")
+            if start < end:
+                yield start, end
+
+    def nearest(self, lat, lon, max_distance=100):
+        """Closest address point within max_distance metres, or None.
+
+        max_distance is capped at MAX_DISTANCE; points outside BERLIN_BOUNDS
+        have no address near them.
+        """
+        import numpy as np
+
+        if not within_berlin(lat, lon):
+            return None
+        max_distance = min(max_distance, MAX_DISTANCE)
+
+        meters_per_degree_lon = METERS_PER_DEGREE * math.cos(math.radians(lat))
+        rings = math.ceil(max_distance / (CELL_SIZE * meters_per_degree_lon))
+
+        best = None
+        best_distance = max_distance
+        table = self._table
+        for start, end in self._candidates(lat, lon, rings):
+            rows = self._order[start:end]
+            dy = (table.lat[rows] - lat) * METERS_PER_DEGREE
+            dx = (table.lon[rows] - lon) * meters_per_degree_lon
+            distances = np.hypot(dx, dy)
+
+            i = int(distances.argmin())
+            if distances[i] <= best_distance:
+                best = int(rows[i])
+                best_distance = float(distances[i])
+
+        if best is None:
+            return None
+
+        return {
+            "wol": QUALITIES[table.wol[best]],
+            "stadtteil": STADTTEILE[table.stadtteil[best]],
+            "district": BERLIN_DISTRICTS[table.district[best]],
+            "distance_m": round(best_distance, 1),
+        }
+
+    def nearest_many(self, coordinates, max_distance=100):
+        return [self.nearest(lat, lon, max_distance) for lat, lon in coordinates]
+
+
+_grid_index = SnapshotValue(GridIndex, source=get_address_table)
+
+
+def get_grid_index():
+    return _grid_index.get()
+
+
+def get_location_data_by_coordinates(lat, lon, max_distance=100):
+    return get_grid_index().nearest(lat, lon, max_distance)
+
+
+def register_location_routes(app):
+
+    @app.server.route("/api/location", methods=["GET", "POST"])
+    def location_by_coordinates():
+        max_distance = request.args.get("max_distance", 100, type=float)
+        if not (max_distance is not None and 0 <= max_distance < math.inf):
+            error = "max_distance must be a finite number of metres, at least 0"
+            return jsonify({"error": error}), 400
+        max_distance = min(max_distance, MAX_DISTANCE)
+
+        if request.method == "POST":
+            # Batch lookup: {"coordinates": [[lat, lon], ...]}
+            payload = request.get_json(silent=True) or {}
+            try:
+                coordinates = [
+                    (float(lat), float(lon))
+                    for lat, lon in payload.get("coordinates", [])
+                ]
+            except (AttributeError, TypeError, ValueError):
+                return jsonify({"error": "invalid coordinates"}), 400
+            if not all(within_berlin(lat, lon) for lat, lon in coordinates):
+                return jsonify({"error": "coordinates must be within Berlin"}), 400
+        else:
+            lat = request.args.get("lat", type=float)
+            lon = request.args.get("lon", type=float)
+            if lat is None or lon is None:
+                return jsonify({"error": "lat and lon are required"}), 400
+            if not within_berlin(lat, lon):
+                return jsonify({"error": "coordinates must be within Berlin"}), 400
+
+        try:
+            index = get_grid_index()
+        except WFSError:
+            return jsonify({"error": "address data is not available right now"}), 503
+
+        if request.method == "POST":
+            return jsonify({"locations": index.nearest_many(coordinates, max_distance)})
+
+        location = index.nearest(lat, lon, max_distance)
+        if location is None:
+            return jsonify({"error": "no address found near these coordinates"}), 404
+
+        return jsonify(location)
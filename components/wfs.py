@@ -0,0 +1,82 @@
+import time
+from contextlib import contextmanager
+
+WFS_URL = "https://gdi.berlin.de/services/wfs/wohnlagenadr2024"
+WFS_TYPENAME = "wohnlagenadr2024:wohnlagenadr2024"
+# Name of the point geometry, PROPERTYNAME must list it to get coordinates
+WFS_GEOMETRY = "geom"
+
+# Seconds to wait for the service before giving up
+WFS_TIMEOUT = 30
+# Cached WFS results older than this are refreshed in the background
+CACHE_MAX_AGE = 6 * 60 * 60
+
+BERLIN_DISTRICTS = [
+    "Charlottenburg-Wilmersdorf",
+    "Friedrichshain-Kreuzberg",
+    "Lichtenberg",
+    "Marzahn-Hellersdorf",
+    "Mitte",
+    "Neukölln",
+    "Pankow",
+    "Reinickendorf",
+    "Spandau",
+    "Steglitz-Zehlendorf",
+    "Tempelhof-Schöneberg",
+    "Treptow-Köpenick",
+]
+
+
+# time.monotonic() after which no request may wait, see wfs_deadline
+_deadline = None
+
+
+class WFSError(Exception):
+    """The WFS could not be reached or sent an invalid response."""
+
+
+@contextmanager
+def wfs_deadline(seconds):
+    """Give up on every request that would wait beyond seconds from now.
+
+    Not thread-local, meant for startup before the workers are forked.
+    """
+    global _deadline
+    _deadline = time.monotonic() + seconds
+    try:
+        yield
+    finally:
+        _deadline = None
+
+
+def get_features(cql, property_names=None, srs_name=None):
+    import requests
+
+    params = {
+        "SERVICE": "WFS",
+        "REQUEST": "GetFeature",
+        "VERSION": "1.1.0",
+        "TYPENAME": WFS_TYPENAME,
+        "OUTPUTFORMAT": "json",
+        "cql_filter": cql,
+    }
+    if property_names:
+        # Only transfer the attributes we need, the full features are large.
+        params["PROPERTYNAME"] = ",".join(property_names)
+    if srs_name:
+        params["SRSNAME"] = srs_name
+
+    timeout = WFS_TIMEOUT
+    if _deadline is not None:
+        timeout = min(timeout, _deadline - time.monotonic())
+        if timeout <= 0:
+            raise WFSError("WFS deadline passed")
+
+    try:
+        response = requests.get(WFS_URL, params=params, timeout=timeout)
+        response.raise_for_status()
+        data = response.json()
+    except (requests.RequestException, ValueError) as error:
+        raise WFSError(f"WFS request failed: {error}") from error
+
+    return data.get("features", [])
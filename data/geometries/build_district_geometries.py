@@ -0,0 +1,254 @@
+"""Precompute the district geometries for the map view.
+
+Fetches the Berlin district boundaries once, cuts them into shared border
+arcs, simplifies every arc at each level of detail and writes one quantized,
+delta-encoded TopoJSON file per level. Because neighbouring districts share
+their border arcs, simplification never opens gaps between them.
+
+Usage (from the project root):
+    python data/geometries/build_district_geometries.py
+"""
+
+import json
+import os
+import sys
+from collections import defaultdict
+
+import numpy as np
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT)
+
+from components.district_map import GEOMETRY_LEVELS, topology_path
+from components.wfs import BERLIN_DISTRICTS
+
+DISTRICTS_WFS_URL = "https://gdi.berlin.de/services/wfs/alkis_bezirke"
+DISTRICTS_TYPENAME = "alkis_bezirke:bezirksgrenzen"
+
+# Coordinates are stored as integers in units of 1e-5 degrees (about 1 m).
+QUANTIZATION = 1e-5
+
+
+def fetch_districts():
+    params = {
+        "SERVICE": "WFS",
+        "REQUEST": "GetFeature",
+        "VERSION": "1.1.0",
+        "TYPENAME": DISTRICTS_TYPENAME,
+        "OUTPUTFORMAT": "json",
+        "SRSNAME": "EPSG:4326",
+    }
+    response = requests.get(DISTRICTS_WFS_URL, params=params)
+    features = response.json()["features"]
+
+    districts = {}
+    for feature in features:
+        props = feature["properties"]
+        name = props.get("namgem") or props.get("bezname") or props.get("name")
+
+        geometry = feature["geometry"]
+        if geometry["type"] == "Polygon":
+            districts[name] = [geometry["coordinates"]]
+        else:
+            districts[name] = geometry["coordinates"]
+
+    # The map joins the geometries to the data by name, a renamed, missing or
+    # duplicated district would silently drop out of it.
+    if len(districts) != len(features) or set(districts) != set(BERLIN_DISTRICTS):
+        missing = sorted(set(BERLIN_DISTRICTS) - set(districts))
+        unexpected = sorted(set(districts) - set(BERLIN_DISTRICTS), key=str)
+        raise SystemExit(
+            f"District names do not match BERLIN_DISTRICTS: "
+            f"missing {missing}, unexpected {unexpected}"
+        )
+
+    return districts
+
+
+def quantize(districts):
+    # Snapping to one integer grid makes shared border vertices identical.
+    points = np.array(
+        [
+            point[:2]
+            for polygons in districts.values()
+            for polygon in polygons
+            for ring in polygon
+            for point in ring
+        ]
+    )
+    translate = points.min(axis=0)
+
+    def quantize_ring(ring):
+        ring = np.rint((np.array(ring)[:, :2] - translate) / QUANTIZATION).astype(int)
+        quantized = [tuple(ring[0])]
+        for point in map(tuple, ring[1:]):
+            if point != quantized[-1]:
+                quantized.append(point)
+        if quantized[0] != quantized[-1]:
+            quantized.append(quantized[0])
+        return quantized
+
+    quantized = {
+        name: [[quantize_ring(ring) for ring in polygon] for polygon in polygons]
+        for name, polygons in districts.items()
+    }
+    return quantized, translate.tolist()
+
+
+def find_junctions(rings):
+    # A junction is where two borders meet, i.e. a point whose neighbours
+    # differ between the rings passing through it.
+    neighbours = defaultdict(set)
+    for ring in rings:
+        points = ring[:-1]
+        for i, point in enumerate(points):
+            neighbours[point].add(
+                frozenset((points[i - 1], points[(i + 1) % len(points)]))
+            )
+
+    return {point for point, pairs in neighbours.items() if len(pairs) > 1}
+
+
+def cut_ring(ring, junctions):
+    points = ring[:-1]
+    starts = [i for i, point in enumerate(points) if point in junctions]
+    if not starts:
+        # A ring without neighbours is a single closed arc, started at its
+        # smallest point so identical rings produce identical arcs.
+        first = points.index(min(points))
+        points = points[first:] + points[:first]
+        return [points + [points[0]]]
+
+    points = points[starts[0]:] + points[: starts[0]]
+    arcs = []
+    current = [points[0]]
+    for point in points[1:]:
+        current.append(point)
+        if point in junctions:
+            arcs.append(current)
+            current = [point]
+    current.append(points[0])
+    arcs.append(current)
+
+    return arcs
+
+
+def build_arcs(quantized):
+    rings = [
+        ring
+        for polygons in quantized.values()
+        for polygon in polygons
+        for ring in polygon
+    ]
+    junctions = find_junctions(rings)
+
+    arcs = []
+    arc_ids = {}
+
+    def arc_id(arc):
+        key = tuple(arc)
+        if key in arc_ids:
+            return arc_ids[key]
+        if key[::-1] in arc_ids:
+            return ~arc_ids[key[::-1]]
+        arc_ids[key] = len(arcs)
+        arcs.append(arc)
+        return arc_ids[key]
+
+    geometries = {
+        name: [
+            [[arc_id(arc) for arc in cut_ring(ring, junctions)] for ring in polygon]
+            for polygon in polygons
+        ]
+        for name, polygons in quantized.items()
+    }
+
+    return arcs, geometries
+
+
+def simplify(arc, tolerance):
+    """Douglas-Peucker simplification that always keeps both end points."""
+    points = np.array(arc, dtype=float)
+    if len(points) <= 3:
+        return points
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+
+    if (points[0] == points[-1]).all():
+        # Closed arcs keep three points so the ring does not collapse.
+        first, second = len(points) // 3, 2 * len(points) // 3
+        keep[first] = keep[second] = True
+        segments = [(0, first), (first, second), (second, len(points) - 1)]
+    else:
+        segments = [(0, len(points) - 1)]
+
+    while segments:
+        start, end = segments.pop()
+        if end <= start + 1:
+            continue
+
+        a, b = points[start], points[end]
+        inner = points[start + 1 : end]
+        dx, dy = b - a
+        length = np.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(*(inner - a).T)
+        else:
+            cross = dx * (inner[:, 1] - a[1]) - dy * (inner[:, 0] - a[0])
+            distances = np.abs(cross) / length
+
+        i = int(distances.argmax())
+        if distances[i] > tolerance:
+            middle = start + 1 + i
+            keep[middle] = True
+            segments.append((start, middle))
+            segments.append((middle, end))
+
+    return points[keep]
+
+
+def encode_arc(points):
+    points = np.rint(points).astype(int)
+    return np.diff(points, axis=0, prepend=[[0, 0]]).tolist()
+
+
+def build_topology(arcs, geometries, translate, tolerance):
+    tolerance = tolerance / QUANTIZATION
+
+    return {
+        "type": "Topology",
+        "transform": {"scale": [QUANTIZATION, QUANTIZATION], "translate": translate},
+        "arcs": [encode_arc(simplify(arc, tolerance)) for arc in arcs],
+        "objects": {
+            "districts": {
+                "type": "GeometryCollection",
+                "geometries": [
+                    {
+                        "type": "MultiPolygon" if len(polygons) > 1 else "Polygon",
+                        "arcs": polygons if len(polygons) > 1 else polygons[0],
+                        "properties": {"name": name},
+                    }
+                    for name, polygons in geometries.items()
+                ],
+            }
+        },
+    }
+
+
+def main():
+    quantized, translate = quantize(fetch_districts())
+    arcs, geometries = build_arcs(quantized)
+
+    for level, settings in GEOMETRY_LEVELS.items():
+        topology = build_topology(arcs, geometries, translate, settings["tolerance"])
+        path = topology_path(level)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(topology, f, separators=(",", ":"))
+
+        print(f"{level}: {os.path.getsize(path)} bytes")
+
+
+if __name__ == "__main__":
+    main()
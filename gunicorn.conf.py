@@ -0,0 +1,38 @@
+"""Gunicorn settings, all overridable through environment variables.
+
+    gunicorn -c gunicorn.conf.py wsgi:server
+
+Because of preload_app, SIGHUP only replaces the workers with copies of the
+already loaded master: new code and data need scripts/reload_server.sh
+(USR2, then TERM to the old master) or a restart of the master.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get("MIETSPIEGEL_BIND", "0.0.0.0:8050")
+
+workers = int(
+    os.environ.get("MIETSPIEGEL_WORKERS", multiprocessing.cpu_count() * 2 + 1)
+)
+threads = int(os.environ.get("MIETSPIEGEL_THREADS", 4))
+worker_class = "gthread" if threads > 1 else "sync"
+
+# Callbacks spend most of their time waiting for the WFS service.
+timeout = int(os.environ.get("MIETSPIEGEL_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("MIETSPIEGEL_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+
+# Load the app and the shared read-only data once in the master process,
+# workers inherit it copy-on-write.
+preload_app = True
+
+# Recycle workers now and then, staggered so they do not restart together.
+max_requests = int(os.environ.get("MIETSPIEGEL_MAX_REQUESTS", 2000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get("MIETSPIEGEL_ACCESS_LOG", "-")
+loglevel = os.environ.get("MIETSPIEGEL_LOG_LEVEL", "info")
+
+# Used by scripts/reload_server.sh to find the master process
+pidfile = os.environ.get("MIETSPIEGEL_PIDFILE", "gunicorn.pid")
@@ -0,0 +1,85 @@
+"""Measure cold start time and initial payload size of the dashboard.
+
+Usage (from the project root):
+    python scripts/measure_startup.py [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import_time(runs):
+    # Every run is a fresh interpreter, like a new instance of the autoscaler.
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import app"], cwd=ROOT, check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def measure_payload():
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    from app import app
+
+    client = app.server.test_client()
+
+    index = client.get("/")
+    layout = client.get("/_dash-layout")
+    dependencies = client.get("/_dash-dependencies")
+
+    script_sizes = {}
+    for line in index.get_data(as_text=True).split('src="')[1:]:
+        src = line.split('"', 1)[0]
+        if src.startswith("/"):
+            script_sizes[src.split("?", 1)[0]] = len(client.get(src).get_data())
+
+    initial_tab = client.post(
+        "/_dash-update-component",
+        json={
+            "output": "tabs-content.children",
+            "outputs": {"id": "tabs-content", "property": "children"},
+            "inputs": [{"id": "tabs", "property": "value", "value": "calculator"}],
+            "changedPropIds": [],
+        },
+    )
+
+    return {
+        "index_html_bytes": len(index.get_data()),
+        "layout_json_bytes": len(layout.get_data()),
+        "dependencies_json_bytes": len(dependencies.get_data()),
+        "initial_tab_bytes": len(initial_tab.get_data()),
+        "scripts_bytes": sum(script_sizes.values()),
+        "scripts": script_sizes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    timings = measure_import_time(args.runs)
+    payload = measure_payload()
+
+    print(f"Startup (import app), {args.runs} runs:")
+    print(f"  median {statistics.median(timings) * 1000:.0f} ms")
+    print(f"  min    {min(timings) * 1000:.0f} ms")
+    print(f"  max    {max(timings) * 1000:.0f} ms")
+    print("Initial payload:")
+    print(json.dumps({k: v for k, v in payload.items() if k != "scripts"}, indent=2))
+    print("Scripts:")
+    for src, size in sorted(payload["scripts"].items(), key=lambda x: -x[1]):
+        print(f"  {size:>10} {src}")
+
+
+if __name__ == "__main__":
+    main()
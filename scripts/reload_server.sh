@@ -0,0 +1,34 @@
+#!/bin/sh
+# Reload the code and the preloaded data of a running gunicorn server
+# without dropping requests.
+#
+# With preload_app, SIGHUP only forks new workers from the already loaded
+# master, so code and data stay the same. Instead, USR2 starts a new master
+# with its own workers next to the old one; once it is up, TERM shuts the
+# old master down gracefully: its workers finish their requests within
+# graceful_timeout. (WINCH is ignored unless gunicorn runs daemonized.)
+#
+# Usage (from the project root):
+#     sh scripts/reload_server.sh
+
+PIDFILE=${MIETSPIEGEL_PIDFILE:-gunicorn.pid}
+WAIT=${MIETSPIEGEL_RELOAD_WAIT:-120}
+
+old=$(cat "$PIDFILE") || exit 1
+kill -USR2 "$old" || exit 1
+
+# The new master writes the pid file once it has loaded the app.
+i=0
+while [ "$i" -lt "$WAIT" ]; do
+    new=$(cat "$PIDFILE" 2>/dev/null)
+    if [ -n "$new" ] && [ "$new" != "$old" ]; then
+        kill -TERM "$old"
+        echo "Reloaded: master $old replaced by $new"
+        exit 0
+    fi
+    sleep 1
+    i=$((i + 1))
+done
+
+echo "The new master did not start within $WAIT s, keeping master $old" >&2
+exit 1
@@ -0,0 +1,52 @@
+"""WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:server
+"""
+
+import gc
+import logging
+import os
+
+from app import app
+from components.address_index import get_address_index
+from components.editions import get_cell_trends
+from components.mietspiegel import load_mietspiegel_table
+from components.pricebydistrict import get_location_data_by_districts
+from components.spatial_index import get_grid_index
+from components.wfs import wfs_deadline
+
+# Upper bound for the WFS requests of the preload, in seconds
+PRELOAD_TIMEOUT = float(os.environ.get("MIETSPIEGEL_PRELOAD_TIMEOUT", 60))
+
+logger = logging.getLogger(__name__)
+
+
+def preload_shared_data():
+    load_mietspiegel_table()
+    # Aligns the cells of all editions once, before the workers fork.
+    get_cell_trends()
+
+    # Districts that fail are not fatal, the workers fetch them on first use.
+    get_location_data_by_districts()
+
+    try:
+        get_address_index()
+    except Exception:
+        logger.warning("Could not preload the address index")
+
+    try:
+        get_grid_index()
+    except Exception:
+        logger.warning("Could not preload the spatial index")
+
+
+# Past the deadline every WFS request fails right away, so a slow or
+# unavailable WFS cannot hold up the start of the server.
+with wfs_deadline(PRELOAD_TIMEOUT):
+    preload_shared_data()
+
+# Move everything loaded so far out of the garbage collector's reach, so the
+# collector does not touch (and thereby copy) these pages in forked workers.
+gc.freeze()
+
+server = app.server